@@ -1,13 +1,22 @@
 # api/main.py
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Iterator, Optional, Tuple
 from fastapi.staticfiles import StaticFiles
-import sqlite3, re, io, json, threading, time, webbrowser
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+import sqlite3, re, io, json, threading, time, webbrowser, base64, asyncio, functools
 import xml.etree.ElementTree as ET
-import difflib, html
-import os, shutil
+import difflib
+import os, sys, shutil, queue, hashlib, pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+
+from importers.common import fts_escape_phrase, hash_text, memoized, mp_context, normalize_batch, normalize_match_key
+
 try:
     import tkinter as _tk
     from tkinter import filedialog as _filedialog
@@ -17,15 +26,197 @@ except Exception:
 
 DB_PATH = "data/app.sqlite"
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, "") or default)
+    except ValueError:
+        return default
+
+# 接続プール設定（run_dev.bat / run_prod.bat の TDB_POOL_SIZE を参照）
+POOL_SIZE = max(1, _env_int("TDB_POOL_SIZE", 4))
+POOL_WAIT_SEC = 5.0                                   # 全接続が使用中のときの待ち時間（超過時は一時接続）
+SQLITE_CACHE_KB = _env_int("TDB_CACHE_KB", 64 * 1024)  # 接続ごとのページキャッシュ
+SQLITE_MMAP_MB = _env_int("TDB_MMAP_MB", 256)
+
 # ---------------- DB helpers & migration ----------------
-def acquire_con():
-    con = sqlite3.connect(DB_PATH, check_same_thread=False)
+def _open_con(temp_store: str = "MEMORY") -> sqlite3.Connection:
+    con = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
     con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    con.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    con.execute(f"PRAGMA temp_store={temp_store}")
     return con
 
+class _ConnPool:
+    """PRAGMA 設定済みの接続を使い回す簡易プール（最大 size 本を保持）"""
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def get(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _open_con()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=POOL_WAIT_SEC)
+        except queue.Empty:
+            # 混雑時は詰まらせずに一時接続で逃がす（返却時に閉じる）
+            print("[POOL] exhausted, opening overflow connection")
+            return _open_con()
+
+    def put(self, con: sqlite3.Connection):
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            self._discard(con)
+            return
+        if self._idle.qsize() < self.size:
+            self._idle.put(con)
+        else:
+            con.close()
+
+    def _discard(self, con: sqlite3.Connection):
+        try:
+            con.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created = max(0, self._created - 1)
+
+    def close_all(self):
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(con)
+
+_POOL = _ConnPool(POOL_SIZE)
+
+@contextmanager
+def acquire_con():
+    # sqlite3.Connection の with 文と同じく、正常終了で commit・例外で rollback
+    con = _POOL.get()
+    try:
+        yield con
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    finally:
+        _POOL.put(con)
+
+@contextmanager
+def acquire_import_con():
+    # 取込専用の接続（プール外）。一時テーブルにアップロードの全行を置くので一時ファイルに置く
+    # （プールの temp_store=MEMORY のままだと取込のメモリがファイルサイズに比例して増える）
+    con = _open_con(temp_store="FILE")
+    try:
+        yield con
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    finally:
+        con.close()
+
+# 書き込みのたびに進める世代番号（検索系キャッシュはこの値ごとに持ち、古い世代は使わない）
+_data_gen = 0
+_data_gen_lock = threading.Lock()
+
+def data_generation() -> int:
+    return _data_gen
+
+def bump_data_generation():
+    # commit の後に呼ぶこと（読み手は照会前に世代を取るので、古い結果が新しい世代に載らない）
+    global _data_gen
+    with _data_gen_lock:
+        _data_gen += 1
+
 def fts_rebuild(cur: sqlite3.Cursor):
     # Rebuild the whole FTS shadow table from content
     cur.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+    if JA_FTS_ENABLED:
+        cur.execute("INSERT INTO entries_fts_ja(entries_fts_ja) VALUES ('rebuild')")
+
+# entry_pairs の変更を FTS へ差分反映するトリガ（external content の定石）
+FTS_TRIGGERS = {
+    "entry_pairs_fts_ai": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_fts_ai AFTER INSERT ON entry_pairs BEGIN
+            INSERT INTO entries_fts(rowid, en_text, ja_text) VALUES (new.id, new.en_text, new.ja_text);
+        END
+    """,
+    "entry_pairs_fts_ad": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_fts_ad AFTER DELETE ON entry_pairs BEGIN
+            INSERT INTO entries_fts(entries_fts, rowid, en_text, ja_text) VALUES ('delete', old.id, old.en_text, old.ja_text);
+        END
+    """,
+    "entry_pairs_fts_au": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_fts_au AFTER UPDATE OF en_text, ja_text ON entry_pairs BEGIN
+            INSERT INTO entries_fts(entries_fts, rowid, en_text, ja_text) VALUES ('delete', old.id, old.en_text, old.ja_text);
+            INSERT INTO entries_fts(rowid, en_text, ja_text) VALUES (new.id, new.en_text, new.ja_text);
+        END
+    """,
+}
+
+# 日本語は分かち書きが無く unicode61 では文全体が1トークンになるため、ja_text だけ trigram で別に索引する
+JA_FTS_ENABLED = os.environ.get("TDB_JA_FTS", "1") != "0"  # 起動時に trigram が使えなければ False になる
+JA_FTS_TRIGGERS = {
+    "entry_pairs_ftsja_ai": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_ftsja_ai AFTER INSERT ON entry_pairs BEGIN
+            INSERT INTO entries_fts_ja(rowid, ja_text) VALUES (new.id, new.ja_text);
+        END
+    """,
+    "entry_pairs_ftsja_ad": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_ftsja_ad AFTER DELETE ON entry_pairs BEGIN
+            INSERT INTO entries_fts_ja(entries_fts_ja, rowid, ja_text) VALUES ('delete', old.id, old.ja_text);
+        END
+    """,
+    "entry_pairs_ftsja_au": """
+        CREATE TRIGGER IF NOT EXISTS entry_pairs_ftsja_au AFTER UPDATE OF ja_text ON entry_pairs BEGIN
+            INSERT INTO entries_fts_ja(entries_fts_ja, rowid, ja_text) VALUES ('delete', old.id, old.ja_text);
+            INSERT INTO entries_fts_ja(rowid, ja_text) VALUES (new.id, new.ja_text);
+        END
+    """,
+}
+
+def _ensure_ja_fts(cur: sqlite3.Cursor, triggers: set) -> bool:
+    # 戻り値: 新たに作った（全件から構築が必要）か
+    global JA_FTS_ENABLED
+    if not JA_FTS_ENABLED:
+        return False
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name='entries_fts_ja'")
+    created = cur.fetchone() is None
+    if created:
+        try:
+            cur.execute("""
+                CREATE VIRTUAL TABLE entries_fts_ja USING fts5(
+                    ja_text, content='entry_pairs', content_rowid='id', tokenize='trigram'
+                )
+            """)
+        except sqlite3.Error as e:
+            # trigram は SQLite 3.34 以降。無ければ日本語も従来の FTS で検索する
+            print("[SCHEMA] trigram FTS unavailable:", e)
+            JA_FTS_ENABLED = False
+            return False
+    missing = [name for name in JA_FTS_TRIGGERS if name not in triggers]
+    for name in missing:
+        cur.execute(JA_FTS_TRIGGERS[name])
+    return created or bool(missing)
 
 def ensure_schema():
     with acquire_con() as con:
@@ -34,6 +225,10 @@ def ensure_schema():
         cols = {r["name"].lower() for r in cur.fetchall()}
         if "entry_key" not in cols:
             cur.execute("ALTER TABLE entry_pairs ADD COLUMN entry_key TEXT")
+        # 正規化済みキー（取込・編集時に1回だけ計算して保存）
+        for col in ("en_norm", "ja_norm", "en_hash"):
+            if col not in cols:
+                cur.execute(f"ALTER TABLE entry_pairs ADD COLUMN {col} TEXT")
 
         # 旧インデックスを念のため削除
         cur.execute("PRAGMA index_list(entry_pairs)")
@@ -52,15 +247,87 @@ def ensure_schema():
             # 既存重複で作成失敗した場合でも起動は続行（ログだけ）
             print("[SCHEMA] unique index create failed:", e)
 
+        # ソース単位の削除/件数を索引で引けるように
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_entry_source ON entry_pairs(COALESCE(source_name,''))")
+
+        # 完全一致（LOWER(en_text) = LOWER(?)）を索引で引けるように。/query と tools/dump.py が同じ式で使う
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_entry_en_lower ON entry_pairs(LOWER(en_text), COALESCE(source_name,''), priority)")
+
+        # 正規化キーのハッシュで引く（DB 上の公式データとの照合）
+        cur.execute("CREATE INDEX IF NOT EXISTS ix_entry_en_hash ON entry_pairs(en_hash, COALESCE(source_name,''))")
+        _backfill_norm_keys(cur)
+
+        # FTS 差分同期トリガ（新規に張った場合のみ一度だけ全再構築して整合を取る）
+        cur.execute("SELECT name FROM sqlite_master WHERE type='trigger'")
+        triggers = {r["name"] for r in cur.fetchall()}
+        missing = [name for name in FTS_TRIGGERS if name not in triggers]
+        for name in missing:
+            cur.execute(FTS_TRIGGERS[name])
+        ja_new = _ensure_ja_fts(cur, triggers)
+        if missing:
+            print("[SCHEMA] FTS triggers installed:", missing, "-> rebuild once")
+            fts_rebuild(cur)
+        elif ja_new:
+            print("[SCHEMA] JA trigram FTS installed -> rebuild once")
+            cur.execute("INSERT INTO entries_fts_ja(entries_fts_ja) VALUES ('rebuild')")
+
         con.commit()
 
 
+def norm_keys(en_text: Optional[str], ja_text: Optional[str]) -> Tuple[str, str, str]:
+    # (en_norm, ja_norm, en_hash)。BG3 照合と同じ正規化
+    en_norm = normalize_match_key(en_text or "")
+    return en_norm, normalize_match_key(ja_text or ""), hash_text(en_norm)
+
+def _backfill_norm_keys(cur: sqlite3.Cursor):
+    # 正規化キー導入前の行（en_hash が空）を埋める。FTS トリガは en_text/ja_text の更新でしか動かない
+    t0 = time.perf_counter()
+    done = 0
+    while True:
+        cur.execute("SELECT id, en_text, ja_text FROM entry_pairs WHERE en_hash IS NULL LIMIT ?", (IMPORT_BATCH,))
+        rows = cur.fetchall()
+        if not rows:
+            break
+        cur.executemany("UPDATE entry_pairs SET en_norm=?, ja_norm=?, en_hash=? WHERE id=?",
+                        [(*norm_keys(r["en_text"], r["ja_text"]), r["id"]) for r in rows])
+        done += len(rows)
+    if done:
+        print(f"[SCHEMA] normalized keys backfilled rows={done} ({time.perf_counter() - t0:.2f}s)")
+
 def normalize_sources_filter(sources: Optional[List[str]]) -> List[str]:
     return [s for s in (sources or []) if s is not None and s != ""]
 
-def fts_escape_phrase(s: str) -> str:
-    # FTS列名扱いを避けるため強制フレーズ化
-    return f"\"{(s or '').replace('\"','\"\"')}\""
+# ---------------- heavy work executor ----------------
+# 取込・照合・バンドル作成はイベントループを止めないよう専用スレッドで実行し、種類ごとに同時実行数を制限する。
+# 検索などの軽い API は FastAPI 既定のスレッドプールで動くので、重い処理と取り合わない。
+HEAVY_LIMITS = {
+    "import": max(1, _env_int("TDB_MAX_IMPORTS", 1)),   # SQLite の書き込みは1本ずつ
+    "match": max(1, _env_int("TDB_MAX_MATCHES", 2)),
+    "bundle": max(1, _env_int("TDB_MAX_BUNDLES", 1)),
+}
+_heavy_executor = ThreadPoolExecutor(max_workers=sum(HEAVY_LIMITS.values()), thread_name_prefix="heavy")
+_heavy_sems: Dict[str, asyncio.Semaphore] = {}
+
+async def run_heavy(kind: str, fn: Callable, *args):
+    sem = _heavy_sems.get(kind)
+    if sem is None:
+        sem = _heavy_sems[kind] = asyncio.Semaphore(HEAVY_LIMITS[kind])
+    async with sem:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_heavy_executor, functools.partial(fn, *args))
+
+# 実行中ジョブへの進捗通知（ジョブ外から呼ばれた場合は何もしない）
+_job_local = threading.local()
+
+def job_progress(**fields):
+    job = getattr(_job_local, "job", None)
+    if job is not None:
+        job.update(**fields)
+
+def job_progress_add(**deltas):
+    job = getattr(_job_local, "job", None)
+    if job is not None:
+        job.add(**deltas)
 
 # ---------------- FastAPI app ----------------
 app = FastAPI(title="Translation DB Tool API")
@@ -83,6 +350,11 @@ def _on_startup():
             pass
     threading.Thread(target=_open, daemon=True).start()
 
+@app.on_event("shutdown")
+def _on_shutdown():
+    _heavy_executor.shutdown(wait=False, cancel_futures=True)
+    _POOL.close_all()
+
 @app.get("/health")
 def health():
     return {"ok": True}
@@ -108,41 +380,222 @@ def delete_source(source_name: str):
         cur = con.cursor()
         cur.execute("SELECT COUNT(*) AS c FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
         before = cur.fetchone()["c"]
+        # FTS はトリガで該当行のみ削除される
         cur.execute("DELETE FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
+        con.commit()
+    bump_data_generation()
+    return {"deleted": before, "source_name": source_name}
+
+# ---------------- /admin ----------------
+@app.post("/admin/fts/rebuild")
+def admin_fts_rebuild():
+    # 通常はトリガで差分同期されるため、不整合が疑われる時だけ手動で実行する
+    t0 = time.perf_counter()
+    with acquire_con() as con:
+        cur = con.cursor()
         fts_rebuild(cur)
         con.commit()
-        return {"deleted": before, "source_name": source_name}
-
+        cur.execute("SELECT COUNT(*) AS c FROM entry_pairs")
+        rows = cur.fetchone()["c"]
+    bump_data_generation()
+    elapsed = time.perf_counter() - t0
+    print(f"[ADMIN] fts rebuild rows={rows} elapsed={elapsed:.2f}s")
+    return {"rebuilt": True, "rows": rows, "elapsed_sec": round(elapsed, 3)}
+
+@app.get("/admin/cache")
+def admin_cache_stats():
+    return {"generation": data_generation(),
+            "search": _search_cache.stats(), "search_count": _search_count_cache.stats(),
+            "query": _query_cache.stats()}
+
+@app.post("/admin/cache/clear")
+def admin_cache_clear():
+    for c in (_search_cache, _search_count_cache, _query_cache):
+        c.clear()
+    return {"cleared": True}
+
+# ---------------- result cache ----------------
+# /search と /query の結果をプロセス内 LRU に保持する。キーの先頭にデータ世代を含めるので、
+# 書き込み（bump_data_generation）後は古い結果に当たらず、追い出しで自然に消える。
+class _ResultCache:
+    """件数上限付きの LRU（スレッド安全、hit/miss を数える）"""
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[object]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, value: object):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._data), "max": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+RESULT_CACHE_MAX = _env_int("TDB_RESULT_CACHE", 2048)  # 0 で無効
+_search_cache = _ResultCache(max(0, RESULT_CACHE_MAX // 8))
+_search_count_cache = _ResultCache(max(0, RESULT_CACHE_MAX // 8))
+_query_cache = _ResultCache(max(0, RESULT_CACHE_MAX))   # /query は語単位
+
+
+# ---------------- ranking ----------------
+# /search・/query の並び順。SQL 内で計算し、小さいほど上位（bm25 と同じ向き）:
+#   bm25（列の重み付き、負値）× (1 + priority/100) − 完全一致ボーナス − フレーズ包含ボーナス + 長さペナルティ
+# priority の高い行（公式など）が低い行（MOD など）に埋もれず、LIMIT で切っても上位が欠けない。
+RANK_COLUMN_WEIGHTS = (1.0, 0.5)   # entries_fts の (en_text, ja_text)
+RANK_EXACT_BONUS = 20.0            # 正規化した本文が検索語と一致
+RANK_PHRASE_BONUS = 2.0            # 検索語を連続した文字列として含む（語句検索へのフォールバック時に効く）
+RANK_LENGTH_PENALTY = 0.002        # 1文字あたり（長い文章より短い語を上に）
+RANK_MODES = ("priority", "bm25")  # bm25: 従来どおり bm25 だけで並べる
+RANK_QUERY_POOL = 10               # /query: 語ごとに bm25 上位 (取得上限×この値) 件だけに priority 込みのスコアを付ける
+
+def _rank_sql(bm25_sql: str, lang: str, term_sql: str = "?", mode: str = "priority") -> Tuple[str, int]:
+    # 戻り値: (スコア式, 式中の term_sql の個数)。term_sql は "?"（値を個数分渡す）か列参照
+    if mode == "bm25":
+        return bm25_sql, 0
+    col = "COALESCE(e.en_norm, e.en_text)" if lang == "en" else "COALESCE(e.ja_norm, e.ja_text)"
+    sql = (f"(({bm25_sql}) * (1.0 + MAX(COALESCE(e.priority, 100), 0) / 100.0)"
+           f" - (CASE WHEN LOWER({col}) = LOWER({term_sql}) THEN {RANK_EXACT_BONUS}"
+           f" WHEN instr(LOWER({col}), LOWER({term_sql})) > 0 THEN {RANK_PHRASE_BONUS} ELSE 0.0 END)"
+           f" + length({col}) * {RANK_LENGTH_PENALTY})")
+    return sql, 2
+
+def _rank_mode(rank: str) -> str:
+    if rank not in RANK_MODES:
+        raise HTTPException(400, f"rank must be one of {', '.join(RANK_MODES)}")
+    return rank
 
 # ---------------- /search ----------------
+# 総件数は (FTS クエリ, 絞り込み, データ世代) ごとにキャッシュし、ページ送りはカーソル (score, id) で続きから引く
+
+def _encode_search_cursor(score: float, id: int) -> str:
+    raw = json.dumps([score, id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_search_cursor(token: str) -> Tuple[float, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        score, id = json.loads(raw)
+        return float(score), int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+# かな・カナ・漢字（半角カナ含む）を含む検索語は ja_text の trigram 索引へ回す
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]")
+JA_TRIGRAM_MIN = 3  # trigram で引ける最短の長さ（これ未満は ja_text の LIKE で走査）
+SEARCH_LANGS = ("auto", "en", "ja")
+
+def _search_lang(lang: str) -> str:
+    # 綴り違い（jp など）を黙って EN 検索にしない
+    if lang not in SEARCH_LANGS:
+        raise HTTPException(400, f"lang must be one of {', '.join(SEARCH_LANGS)}")
+    return lang
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 @app.get("/search")
 def search(q: str, page: int = 1, size: int = 50,
            max_len: int = 0,
            min_priority: Optional[int] = None,
-           sources: Optional[List[str]] = None):
-    off = max(0, (page - 1) * size)
-
-    def run_with_fts_query(fts_q: str):
-        where = ["entries_fts MATCH ?"]
+           sources: Optional[List[str]] = None,
+           cursor: Optional[str] = None,   # ← 前ページの next_cursor。指定時は page より優先
+           lang: str = "auto",             # ← auto: 文字種で判定 / en: 従来の FTS / ja: ja_text の trigram 索引
+           rank: str = "priority"):        # ← priority: bm25×priority＋完全一致・長さ補正 / bm25: bm25 のみ
+    q = " ".join(q.split())  # 空白の違いは同じ検索として扱う（FTS のトークン化でも同じ）
+    srcs = normalize_sources_filter(sources)
+    rank = _rank_mode(rank)
+    lang = _search_lang(lang)
+    after = _decode_search_cursor(cursor) if cursor else None
+    off = 0 if after else max(0, (page - 1) * size)
+    gen = data_generation()  # 照会より前に取る
+
+    ja = JA_FTS_ENABLED and (lang == "ja" or (lang == "auto" and _CJK_RE.search(q) is not None))
+    if not ja:
+        route = "en"
+        from_sql = "entries_fts JOIN entry_pairs e ON entries_fts.rowid = e.id"
+        match_sql = "entries_fts MATCH ?"
+        bm25_sql = "bm25(entries_fts)" if rank == "bm25" else "bm25(entries_fts, {}, {})".format(*RANK_COLUMN_WEIGHTS)
+    elif len(q) >= JA_TRIGRAM_MIN:
+        route = "ja"
+        from_sql = "entries_fts_ja JOIN entry_pairs e ON entries_fts_ja.rowid = e.id"
+        match_sql, bm25_sql = "entries_fts_ja MATCH ?", "bm25(entries_fts_ja)"
+    else:
+        # 1〜2文字は trigram に載らないので ja_text を直接走査（bm25 は無いので一律 -1 として補正だけ掛ける。bm25 指定時は id 順）
+        route = "ja-like"
+        from_sql = "entry_pairs e"
+        match_sql, bm25_sql = "e.ja_text LIKE ? ESCAPE '\\'", "0.0" if rank == "bm25" else "-1.0"
+    score_sql, n_score = _rank_sql(bm25_sql, "en" if route == "en" else "ja", "?", rank)
+    score_params: List[object] = [q] * n_score
+
+    def filters(fts_q: str) -> Tuple[List[str], List[object]]:
+        where = [match_sql]
         params: List[object] = [fts_q]
         if min_priority is not None:
             where.append("e.priority >= ?")
             params.append(min_priority)
-        srcs = normalize_sources_filter(sources)
         if srcs:
             where.append(f"COALESCE(e.source_name,'') IN ({','.join('?' for _ in srcs)})")
             params.extend(srcs)
+        return where, params
+
+    def count_hits(fts_q: str) -> int:
+        key = (gen, route, fts_q, min_priority, tuple(srcs))
+        hit = _search_count_cache.get(key)
+        if hit is not None:
+            return hit
+        where, params = filters(fts_q)
+        cur.execute(
+            f"""
+            SELECT COUNT(*) AS c
+            FROM {from_sql}
+            WHERE {' AND '.join(where)}
+            """,
+            params,
+        )
+        total = cur.fetchone()["c"]
+        _search_count_cache.put(key, total)
+        return total
+
+    def run_with_fts_query(fts_q: str):
+        where, params = filters(fts_q)
+        if after:
+            # キーセット: 前ページ末尾 (score, id) より後ろだけを返す（OFFSET の行は返さない）。
+            # score は bm25 からの計算値で索引が無いので、ヒット全件の score 計算と前ページ末尾より後ろの
+            # 並べ替え（LIMIT 付きなので上位 size 件の保持）は毎回かかる。深いページで減るのは読み捨てる行だけ
+            where.append(f"({score_sql} > ? OR ({score_sql} = ? AND e.id > ?))")
+            params.extend([*score_params, after[0], *score_params, after[0], after[1]])
         cur.execute(
             f"""
             SELECT e.id, e.en_text AS en, e.ja_text AS ja, e.source_name AS source, e.priority,
-                   bm25(entries_fts) AS score
-            FROM entries_fts
-            JOIN entry_pairs e ON entries_fts.rowid = e.id
+                   {score_sql} AS score
+            FROM {from_sql}
             WHERE {' AND '.join(where)}
-            ORDER BY score ASC
+            ORDER BY score ASC, e.id ASC
             LIMIT ? OFFSET ?
             """,
-            (*params, size, off),
+            (*score_params, *params, size, off),
         )
         rows = cur.fetchall()
         items = []
@@ -162,20 +615,32 @@ def search(q: str, page: int = 1, size: int = 50,
             })
         return items
 
-    srcs_dbg = normalize_sources_filter(sources)
-    print(f"[SEARCH] q='{q}' size={size} minp={min_priority} sources={srcs_dbg} page={page}")
+    print(f"[SEARCH] q='{q}' route={route} rank={rank} size={size} minp={min_priority} sources={srcs} page={page} cursor={'yes' if after else 'no'}")
+    cache_key = (gen, route, rank, q, page, size, max_len, min_priority, tuple(srcs), cursor or "")
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        print("[SEARCH] cache hit")
+        return cached
 
     with acquire_con() as con:
         cur = con.cursor()
         # まずはフレーズ検索
-        fts_q = fts_escape_phrase(q)
-        items = run_with_fts_query(fts_q)
-        # 0件なら語句検索
-        if not items and " " in q:
+        fts_q = f"%{_like_escape(q)}%" if route == "ja-like" else fts_escape_phrase(q)
+        total = count_hits(fts_q)
+        # 0件なら語句検索（ページ単位ではなく総件数で判定する）
+        if total == 0 and " " in q and route != "ja-like":
             print("[SEARCH] fallback to terms:", q)
-            items = run_with_fts_query(q)
-        print(f"[SEARCH] hits={len(items)}")
-        return {"items": items, "total": len(items)}
+            fts_q = q
+            total = count_hits(fts_q)
+        items = run_with_fts_query(fts_q) if total else []
+        next_cursor = None
+        # カーソル指定時も page は表示上の位置として受け取る
+        if len(items) == size and max(0, (page - 1) * size) + len(items) < total:
+            next_cursor = _encode_search_cursor(items[-1]["score"], items[-1]["id"])
+        print(f"[SEARCH] hits={len(items)} total={total}")
+    result = {"items": items, "total": total, "page": page, "next_cursor": next_cursor, "lang": "en" if route == "en" else "ja"}
+    _search_cache.put(cache_key, result)
+    return result
 
 # ---------------- /query ----------------
 class QueryIn(BaseModel):
@@ -186,6 +651,9 @@ class QueryIn(BaseModel):
     word_boundary: bool = False
     min_priority: Optional[int] = None
     sources: Optional[List[str]] = None
+    batch: bool = True   # 一時テーブル＋まとめた SQL で全行を一括照会（False で1行ずつ）
+    stream: bool = False # True で NDJSON（1行1語）を解決した順に逐次返す
+    rank: str = "priority"  # FTS 補完の並び順（/search と同じ。bm25 で bm25 のみ）
 
 _word_re_cache = {}
 def word_boundary_ok(term: str, text: str) -> bool:
@@ -196,11 +664,190 @@ def word_boundary_ok(term: str, text: str) -> bool:
         _word_re_cache[key] = reobj
     return bool(reobj.search(text or ""))
 
-@app.post("/query")
-def query(body: QueryIn):
-    srcs = normalize_sources_filter(body.sources)
+def _query_filters(body: QueryIn, srcs: List[str], alias: str = "") -> Tuple[List[str], List[object]]:
+    col = f"{alias}." if alias else ""
+    where: List[str] = []
+    params: List[object] = []
+    if body.min_priority is not None:
+        where.append(f"{col}priority >= ?")
+        params.append(body.min_priority)
+    if srcs:
+        where.append(f"COALESCE({col}source_name,'') IN ({','.join('?' for _ in srcs)})")
+        params.extend(srcs)
+    return where, params
+
+@contextmanager
+def _query_staging(cur: sqlite3.Cursor):
+    # バッチ照会用の一時テーブル（接続はプールで使い回すため必ず後始末する）
+    cur.execute("DROP TABLE IF EXISTS temp._query_terms")
+    cur.execute("DROP TABLE IF EXISTS temp._query_fts")
+    cur.execute("CREATE TEMP TABLE _query_terms (term TEXT PRIMARY KEY)")
+    cur.execute("CREATE TEMP TABLE _query_fts (term TEXT PRIMARY KEY, phrase TEXT NOT NULL, lim INTEGER NOT NULL)")
+    try:
+        yield
+    finally:
+        cur.execute("DROP TABLE IF EXISTS temp._query_terms")
+        cur.execute("DROP TABLE IF EXISTS temp._query_fts")
+
+def _query_exact_order(body: QueryIn, col: str = "") -> str:
+    # 完全一致が top_k を超える時も priority の高い行から取る（bm25 指定時は従来どおり id 順）
+    return f"{col}id" if body.rank == "bm25" else f"COALESCE({col}priority, 100) DESC, {col}id"
+
+def _query_exact_rows(cur: sqlite3.Cursor, terms: List[str], body: QueryIn, srcs: List[str]) -> Dict[str, List[sqlite3.Row]]:
+    # 全語を一時テーブルに入れ、語ごとに ix_entry_en_lower を引く。LOWER(q.term) と式同士で比べる
+    # （TEXT 列と比べると型親和性が合わず式索引が使われない）。source 条件で別の索引を選ばれないよう固定
+    cur.executemany("INSERT OR IGNORE INTO temp._query_terms (term) VALUES (?)", ((t,) for t in terms))
+    where, params = _query_filters(body, srcs, "e")
+    where.insert(0, "LOWER(e.en_text) = LOWER(q.term)")
+    cur.execute(
+        f"""
+        SELECT q.term AS term, e.en_text AS en, e.ja_text AS ja, e.source_name AS src, e.priority AS pr
+        FROM temp._query_terms q
+        CROSS JOIN entry_pairs e INDEXED BY ix_entry_en_lower ON {' AND '.join(where)}
+        ORDER BY q.rowid, {_query_exact_order(body, "e.")}
+        """,
+        params,
+    )
+    out: Dict[str, List[sqlite3.Row]] = {}
+    for r in cur:
+        lst = out.setdefault(r["term"], [])
+        if len(lst) < body.top_k:  # 1語ずつ引いていた時の LIMIT top_k と同じ
+            lst.append(r)
+    return out
 
-    def add_match(lst, term, en, ja, src, prio) -> bool:
+# FTS 補完で同じ候補（大小無視の en/ja/source と priority）を1行にまとめる。add_match の重複除外と同じキー
+# （bm25 は集約の中で使えないので GROUP BY ではなく、スコアを出した外側のウィンドウ関数で各組の最上位だけ残す）
+_QUERY_DEDUP_SQL = "LOWER(COALESCE(en,'')), LOWER(COALESCE(ja,'')), LOWER(COALESCE(src,'')), pr"
+
+def _query_bm25_sql(body: QueryIn) -> str:
+    return "bm25(entries_fts)" if body.rank == "bm25" else "bm25(entries_fts, {}, {})".format(*RANK_COLUMN_WEIGHTS)
+
+def _query_pool_from(where: List[str]) -> str:
+    # 絞り込みがある時だけ候補の段階で entry_pairs を引く（無ければ FTS だけで bm25 上位を選ぶ）
+    return "entries_fts" + (" CROSS JOIN entry_pairs e ON entries_fts.rowid = e.id" if where else "")
+
+def _query_fts_rows(cur: sqlite3.Cursor, limits: Dict[str, int], body: QueryIn, srcs: List[str]) -> Dict[str, List[sqlite3.Row]]:
+    # limits: 語 -> 取得上限。_query_fts_one と同じ候補・順位を全語まとめて1文で引く。
+    # 語ごとの bm25 上位は相関サブクエリの ORDER BY bm25 LIMIT で取る（LIMIT は全語の最大値で、
+    # 語ごとの上限 lim×RANK_QUERY_POOL には外側のウィンドウ関数で切り詰める）。
+    # bm25 は MATCH した文の中でしか計算できないので、(rowid, bm25) を JSON 配列にして json_each で展開する
+    # （rowid IN (...) で絞って外側でもう一度 MATCH すると bm25 の再計算で倍近く遅い）。17 桁で書けば値は元と一致する
+    cur.executemany("INSERT OR IGNORE INTO temp._query_fts (term, phrase, lim) VALUES (?, ?, ?)",
+                    ((t, fts_escape_phrase(t), n) for t, n in limits.items()))
+    where, params = _query_filters(body, srcs, "e")
+    pool_from = _query_pool_from(where)
+    where.insert(0, "entries_fts MATCH q.phrase")
+    match_sql, bm25_sql = " AND ".join(where), _query_bm25_sql(body)
+    score_sql, _ = _rank_sql("c.b", "en", "c.term", body.rank)
+    cur.execute(
+        f"""
+        SELECT term, en, ja, src, pr FROM (
+            SELECT qid, term, lim, en, ja, src, pr,
+                   ROW_NUMBER() OVER (PARTITION BY qid ORDER BY score, id) AS rn
+            FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY qid, {_QUERY_DEDUP_SQL} ORDER BY score, id) AS dn
+                FROM (
+                    SELECT c.qid AS qid, c.term AS term, c.lim AS lim, e.id AS id, e.en_text AS en, e.ja_text AS ja,
+                           e.source_name AS src, e.priority AS pr, {score_sql} AS score
+                    FROM (
+                        SELECT qid, term, lim, id, b FROM (
+                            SELECT *, ROW_NUMBER() OVER (PARTITION BY qid ORDER BY b, id) AS bn
+                            FROM (
+                                SELECT q.rowid AS qid, q.term AS term, q.lim AS lim,
+                                       j.value ->> 0 AS id, CAST(j.value ->> 1 AS REAL) AS b
+                                FROM temp._query_fts q, json_each((
+                                    SELECT json_group_array(json_array(id, printf('%!.17g', b))) FROM (
+                                        SELECT entries_fts.rowid AS id, {bm25_sql} AS b
+                                        FROM {pool_from}
+                                        WHERE {match_sql}
+                                        ORDER BY b, id
+                                        LIMIT ?
+                                    )
+                                )) j
+                            )
+                        )
+                        WHERE bn <= lim * {RANK_QUERY_POOL}
+                        UNION
+                        SELECT q.rowid, q.term, q.lim, entries_fts.rowid, {bm25_sql}
+                        FROM temp._query_fts q
+                        CROSS JOIN {pool_from}
+                        WHERE {match_sql} AND entries_fts.rowid IN (SELECT id FROM entry_pairs WHERE LOWER(en_text) = LOWER(q.term))
+                    ) c
+                    CROSS JOIN entry_pairs e ON e.id = c.id
+                )
+            )
+            WHERE dn = 1
+        )
+        WHERE rn <= lim
+        ORDER BY qid, rn
+        """,
+        (*params, max(limits.values()) * RANK_QUERY_POOL, *params),
+    )
+    out: Dict[str, List[sqlite3.Row]] = {}
+    for r in cur:
+        out.setdefault(r["term"], []).append(r)
+    return out
+
+def _query_exact_one(cur: sqlite3.Cursor, term: str, body: QueryIn, srcs: List[str]) -> List[sqlite3.Row]:
+    where, params = _query_filters(body, srcs)
+    where.insert(0, "LOWER(en_text) = LOWER(?)")
+    cur.execute(
+        f"""
+        SELECT en_text AS en, ja_text AS ja, source_name AS src, priority AS pr
+        FROM entry_pairs
+        WHERE {' AND '.join(where)}
+        ORDER BY {_query_exact_order(body)}
+        LIMIT ?
+        """,
+        (term, *params, body.top_k),
+    )
+    return cur.fetchall()
+
+def _query_fts_one(cur: sqlite3.Cursor, term: str, limit: int, body: QueryIn, srcs: List[str]) -> List[sqlite3.Row]:
+    # 一致した全行にスコアを付けると重いので、bm25 上位 limit×RANK_QUERY_POOL 件に絞ってから付ける。
+    # 完全一致ボーナスの付く行は bm25 が低くても落とさないよう、ix_entry_en_lower で引いて候補に足す
+    where, params = _query_filters(body, srcs, "e")
+    pool_from = _query_pool_from(where)
+    where.insert(0, "entries_fts MATCH ?")
+    match_sql, bm25_sql = " AND ".join(where), _query_bm25_sql(body)
+    match_params = (fts_escape_phrase(term), *params)
+    score_sql, n_score = _rank_sql("c.b", "en", "?", body.rank)
+    cur.execute(
+        f"""
+        SELECT en, ja, src, pr FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY {_QUERY_DEDUP_SQL} ORDER BY score, id) AS dn
+            FROM (
+                SELECT e.id AS id, e.en_text AS en, e.ja_text AS ja, e.source_name AS src, e.priority AS pr,
+                       {score_sql} AS score
+                FROM (
+                    SELECT * FROM (
+                        SELECT entries_fts.rowid AS id, {bm25_sql} AS b
+                        FROM {pool_from}
+                        WHERE {match_sql}
+                        ORDER BY b, id
+                        LIMIT ?
+                    )
+                    UNION
+                    SELECT entries_fts.rowid AS id, {bm25_sql} AS b
+                    FROM {pool_from}
+                    WHERE {match_sql} AND entries_fts.rowid IN (SELECT id FROM entry_pairs WHERE LOWER(en_text) = LOWER(?))
+                ) c
+                CROSS JOIN entry_pairs e ON e.id = c.id
+            )
+        )
+        WHERE dn = 1
+        ORDER BY score, id
+        LIMIT ?
+        """,
+        (*[term] * n_score, *match_params, limit * RANK_QUERY_POOL, *match_params, term, limit),
+    )
+    return cur.fetchall()
+
+QUERY_STREAM_CHUNK = 500  # NDJSON ストリーム時にまとめて引く行数（この単位で順に返す）
+
+def _resolve_query_terms(uniq: List[str], body: QueryIn, srcs: List[str]) -> Dict[str, List[List[object]]]:
+    # uniq: 重複なしの語。戻り値は 語 -> 候補（スニペット前）
+    def add_match(lst, seen, term, en, ja, src, prio) -> bool:
         # 単語境界（英のみ）
         if body.word_boundary and en and not word_boundary_ok(term, en):
             return False
@@ -212,79 +859,255 @@ def query(body: QueryIn):
         seen.add(key)
         return len(lst) >= body.top_k
 
-    out: List[Dict] = []
-    with acquire_con() as con:
-        cur = con.cursor()
-        for raw in body.lines:
-            term = (raw or "").strip()
-            if not term:
-                out.append({"term": "", "candidates": []})
-                continue
+    def add_rows(term, rows):
+        matches, seen = results[term]
+        for r in rows:
+            if add_match(matches, seen, term, r["en"], r["ja"], r["src"], r["pr"]):
+                break
 
-            matches: List[List[object]] = []
-            seen = set()
+    # 語ごとの候補（スニペット前）をキャッシュ。max_len は後処理なのでキーに含めない
+    gen = data_generation()
+    opts = (body.top_k, body.exact, body.word_boundary, body.min_priority, tuple(srcs), body.rank)
+    done: Dict[str, List[List[object]]] = {}
+    for t in uniq:
+        hit = _query_cache.get((gen, t, *opts))
+        if hit is not None:
+            done[t] = hit
+    uniq = [t for t in uniq if t not in done]
+    if not uniq:
+        return done
+
+    results: Dict[str, Tuple[List[List[object]], set]] = {t: ([], set()) for t in uniq}
+    batch = body.batch and len(uniq) > 1
+    t0 = time.perf_counter()
 
+    with acquire_con() as con:
+        cur = con.cursor()
+        with _query_staging(cur) if batch else nullcontext():
             # 1) 完全一致
             if body.exact:
-                where = ["LOWER(en_text) = LOWER(?)"]
-                params: List[object] = [term]
-                if body.min_priority is not None:
-                    where.append("priority >= ?")
-                    params.append(body.min_priority)
-                if srcs:
-                    where.append(f"COALESCE(source_name,'') IN ({','.join('?' for _ in srcs)})")
-                    params.extend(srcs)
-
-                cur.execute(
-                    f"""
-                    SELECT en_text, ja_text, source_name, priority
-                    FROM entry_pairs
-                    WHERE {' AND '.join(where)}
-                    LIMIT ?
-                    """,
-                    (*params, body.top_k),
-                )
-                for r in cur.fetchall():
-                    if add_match(matches, term, r["en_text"], r["ja_text"], r["source_name"], r["priority"]):
-                        break
-
-            # 2) FTS 補完
-            remain = body.top_k - len(matches)
-            if remain > 0:
-                where = ["entries_fts MATCH ?"]
-                params: List[object] = [fts_escape_phrase(term)]
-                if body.min_priority is not None:
-                    where.append("e.priority >= ?")
-                    params.append(body.min_priority)
-                if srcs:
-                    where.append(f"COALESCE(e.source_name,'') IN ({','.join('?' for _ in srcs)})")
-                    params.extend(srcs)
-
-                cur.execute(
-                    f"""
-                    SELECT e.en_text AS en, e.ja_text AS ja, e.source_name AS src, e.priority AS pr
-                    FROM entries_fts
-                    JOIN entry_pairs e ON entries_fts.rowid = e.id
-                    WHERE {' AND '.join(where)}
-                    LIMIT ?
-                    """,
-                    (*params, remain * 6),
-                )
-                for r in cur.fetchall():
-                    if add_match(matches, term, r["en"], r["ja"], r["src"], r["pr"]):
-                        break
-
-            # 3) 長文スニペット
-            if body.max_len and body.max_len > 0:
-                cut = body.max_len
-                for i in range(len(matches)):
-                    en, ja, src, pr = matches[i]
-                    if len(en) > cut: en = en[:cut] + "…"
-                    if len(ja) > cut: ja = ja[:cut] + "…"
-                    matches[i] = [en, ja, src, pr]
-
-            out.append({"term": term, "candidates": matches})
-    return out
+                if batch:
+                    exact = _query_exact_rows(cur, uniq, body, srcs)
+                    for term in uniq:
+                        add_rows(term, exact.get(term, []))
+                else:
+                    for term in uniq:
+                        add_rows(term, _query_exact_one(cur, term, body, srcs))
+
+            # 2) FTS 補完（SQL 側でランキング・重複まとめ済み。完全一致で取った分と重なり得るのでその件数だけ多めに取る。
+            #    単語境界は Python で絞るので従来どおり多めに取る）
+            limits = {}
+            for t in uniq:
+                have = len(results[t][0])
+                if have < body.top_k:
+                    limits[t] = (body.top_k - have) * 6 if body.word_boundary else body.top_k
+            if limits:
+                if batch:
+                    fts = _query_fts_rows(cur, limits, body, srcs)
+                    for term in limits:
+                        add_rows(term, fts.get(term, []))
+                else:
+                    for term, limit in limits.items():
+                        add_rows(term, _query_fts_one(cur, term, limit, body, srcs))
+
+    if batch:
+        print(f"[QUERY] batch terms={len(uniq)} cached={len(done)} ({time.perf_counter() - t0:.2f}s)")
+    for t in uniq:
+        done[t] = results[t][0]
+        _query_cache.put((gen, t, *opts), results[t][0])
+    return done
+
+def _query_result(term: str, candidates: List[List[object]], max_len: int) -> Dict:
+    # 3) 長文スニペット
+    matches = [list(m) for m in candidates]
+    if max_len and max_len > 0:
+        cut = max_len
+        for i in range(len(matches)):
+            en, ja, src, pr = matches[i]
+            if len(en) > cut: en = en[:cut] + "…"
+            if len(ja) > cut: ja = ja[:cut] + "…"
+            matches[i] = [en, ja, src, pr]
+    return {"term": term, "candidates": matches}
+
+def _query_ndjson(terms: List[str], body: QueryIn, srcs: List[str]) -> Iterator[str]:
+    # QUERY_STREAM_CHUNK 行ずつ解決し、入力順に1行1 JSON で返す（全体をメモリに溜めない）
+    for i in range(0, len(terms), QUERY_STREAM_CHUNK):
+        part = terms[i:i + QUERY_STREAM_CHUNK]
+        done = _resolve_query_terms(list(dict.fromkeys(t for t in part if t)), body, srcs)
+        yield "".join(json.dumps(_query_result(t, done.get(t, []), body.max_len), ensure_ascii=False) + "\n"
+                      for t in part)
+
+@app.post("/query")
+def query(body: QueryIn):
+    srcs = normalize_sources_filter(body.sources)
+    _rank_mode(body.rank)
+    terms = [(raw or "").strip() for raw in body.lines]
+    if body.stream:
+        return StreamingResponse(_query_ndjson(terms, body, srcs), media_type="application/x-ndjson")
+
+    done = _resolve_query_terms(list(dict.fromkeys(t for t in terms if t)), body, srcs)  # 同じ語は1回だけ引く
+    return [_query_result(t, done.get(t, []), body.max_len) for t in terms]
+
+# ---------------- glossary annotate ----------------
+# 長い MOD 文の中から、辞書（entry_pairs.en_text）の語を全部見つけて訳を添える。
+# 語はトークン列（単語・記号単位、小文字化）の trie にまとめ、本文を先頭から1回なめて最長一致を取る。
+# トークン単位なので単語の途中では一致しない（"ace" が "place" に当たらない）。trie はデータ世代ごとにキャッシュ。
+_ANN_TOKEN_RE = re.compile(r"<[^>]*>|\w+|[^\w\s]")
+_ANN_TERM = ""  # trie の終端マーカ（空トークンは出ないので衝突しない）
+ANNOTATE_MAX_CANDIDATES = 10  # 1語あたり保持する候補数（priority 降順）
+ANNOTATE_CACHE_MAX = 4
+
+def _ann_tokens(text: str) -> List[Tuple[int, int, str]]:
+    # (開始, 終了, 比較用トークン)。タグ <...> は1トークンにして語の一致を区切る
+    low = text.replace("’", "'")
+    if len(low.lower()) == len(low):
+        low = low.lower()
+    else:
+        low = "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in low)  # 位置がずれないように
+    return [(m.start(), m.end(), m.group()) for m in _ANN_TOKEN_RE.finditer(low)]
+
+class _GlossaryTrie:
+    def __init__(self):
+        self.root: Dict[str, object] = {}
+        self.terms = 0
+
+    def add(self, tokens: List[str], cand: Tuple[str, str, str, int]):
+        node = self.root
+        for t in tokens:
+            node = node.setdefault(t, {})
+        lst = node.get(_ANN_TERM)
+        if lst is None:
+            lst = node[_ANN_TERM] = []
+            self.terms += 1
+        if cand not in lst:
+            lst.append(cand)
+
+    def finish(self):
+        # 候補を priority 降順（同順位は登録順 = id 順）に並べて上限で切る
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            for k, v in node.items():
+                if k == _ANN_TERM:
+                    v.sort(key=lambda c: -(c[3] or 0))
+                    del v[ANNOTATE_MAX_CANDIDATES:]
+                else:
+                    stack.append(v)
+
+    def scan(self, text: str, overlap: bool = False) -> List[Tuple[int, int, List[Tuple[str, str, str, int]]]]:
+        # 戻り値は (開始, 終了, 候補)。overlap=False は左から最長一致で重ならないように選ぶ
+        toks = _ann_tokens(text)
+        out = []
+        i, n = 0, len(toks)
+        while i < n:
+            node, j, best = self.root, i, None
+            while j < n:
+                node = node.get(toks[j][2])
+                if node is None:
+                    break
+                j += 1
+                cands = node.get(_ANN_TERM)
+                if cands:
+                    if overlap:
+                        out.append((toks[i][0], toks[j - 1][1], cands))
+                    best = (j, cands)
+            if best and not overlap:
+                out.append((toks[i][0], toks[best[0] - 1][1], best[1]))
+                i = best[0]
+            else:
+                i += 1
+        return out
+
+_glossary_cache: "OrderedDict[Tuple, _GlossaryTrie]" = OrderedDict()
+_glossary_lock = threading.Lock()
+
+def _get_glossary(srcs: List[str], min_priority: Optional[int], max_words: int) -> _GlossaryTrie:
+    key = (data_generation(), tuple(srcs), min_priority, max_words)
+    with _glossary_lock:
+        hit = _glossary_cache.get(key)
+        if hit is not None:
+            _glossary_cache.move_to_end(key)
+            return hit
+        t0 = time.perf_counter()
+        trie = _GlossaryTrie()
+        where, params = ["ja_text IS NOT NULL", "ja_text <> ''"], []
+        if min_priority is not None:
+            where.append("priority >= ?")
+            params.append(min_priority)
+        if srcs:
+            where.append(f"COALESCE(source_name,'') IN ({','.join('?' for _ in srcs)})")
+            params.extend(srcs)
+        with acquire_con() as con:
+            cur = con.cursor()
+            # 保存済みの正規化キー（実体参照・タグ除去、空白畳み）を使い、長い文は語として扱わない
+            cur.execute(f"""
+                SELECT en_text, ja_text, source_name, priority, COALESCE(en_norm, en_text) AS k
+                FROM entry_pairs
+                WHERE {' AND '.join(where)} AND length(COALESCE(en_norm, en_text)) <= ?
+                ORDER BY id
+            """, (*params, max_words * 24))
+            for r in cur:
+                toks = [t for _, _, t in _ann_tokens(r["k"])]
+                words = sum(1 for t in toks if t[0].isalnum() or t[0] == "_")
+                if not words or words > max_words:
+                    continue
+                trie.add(toks, (r["en_text"], r["ja_text"], r["source_name"] or "", r["priority"]))
+        trie.finish()
+        print(f"[ANNOTATE] glossary built terms={trie.terms} ({time.perf_counter() - t0:.2f}s)")
+        _glossary_cache[key] = trie
+        while len(_glossary_cache) > ANNOTATE_CACHE_MAX:
+            _glossary_cache.popitem(last=False)
+        return trie
+
+def _annotate_spans(trie: _GlossaryTrie, text: str, top_k: int, overlap: bool) -> List[Dict]:
+    return [{"start": a, "end": b, "text": text[a:b],
+             "candidates": [{"en": en, "ja": ja, "source": src, "priority": pr} for en, ja, src, pr in cands[:top_k]]}
+            for a, b, cands in trie.scan(text, overlap)]
+
+class AnnotateIn(BaseModel):
+    text: Optional[str] = None
+    lines: Optional[List[str]] = None
+    top_k: int = 3
+    max_term_words: int = 6  # これより長い en_text は語として扱わない（文章は対象外）
+    overlap: bool = False    # True で重なり・入れ子の一致も全部返す
+    min_priority: Optional[int] = None
+    sources: Optional[List[str]] = None
+
+@app.post("/annotate")
+def annotate(body: AnnotateIn):
+    trie = _get_glossary(normalize_sources_filter(body.sources), body.min_priority, max(1, body.max_term_words))
+    texts = body.lines if body.lines is not None else [body.text or ""]
+    results = [{"text": t or "", "spans": _annotate_spans(trie, t or "", body.top_k, body.overlap)} for t in texts]
+    # 中身は dict/str/int だけなので jsonable_encoder を通さずに返す（長文でスパンが数万件になるとそこが支配的）
+    return JSONResponse({"terms": trie.terms, "results": results})
+
+@app.post("/annotate/xml")
+async def annotate_xml(
+    modfile: UploadFile = File(...),
+    top_k: int = Form(3),
+    max_term_words: int = Form(6),
+    overlap: bool = Form(False),
+    min_priority: Optional[int] = Form(None),
+    sources: List[str] = Form([])  # ← source_name で絞る（複数可）
+):
+    return await run_heavy("match", _annotate_xml_sync, modfile, top_k, max_term_words, overlap, min_priority, sources)
+
+def _annotate_xml_sync(modfile: UploadFile, top_k: int, max_term_words: int, overlap: bool,
+                       min_priority: Optional[int], sources: List[str]) -> Dict:
+    trie = _get_glossary(normalize_sources_filter(sources), min_priority, max(1, max_term_words))
+    t0 = time.perf_counter()
+    out, total, spans = [], 0, 0
+    try:
+        for uid, ver, text in _iter_xml_contents(modfile.file):
+            total += 1
+            found = _annotate_spans(trie, text, top_k, overlap)
+            if found:
+                spans += len(found)
+                out.append({"uid": uid, "version": ver, "text": text, "spans": found})
+    except ET.ParseError as e:
+        raise HTTPException(400, f"XML parse error: {e}")
+    print(f"[ANNOTATE] xml contents={total} annotated={len(out)} spans={spans} ({time.perf_counter() - t0:.2f}s)")
+    return JSONResponse({"terms": trie.terms, "contents": total, "annotated": len(out), "spans": spans, "results": out})
 
 # ---------------- inline edit ----------------
 class EntryUpdate(BaseModel):
@@ -293,10 +1116,6 @@ class EntryUpdate(BaseModel):
     source_name: Optional[str] = None
     priority: Optional[int] = None
 
-def _update_fts_for_id(cur: sqlite3.Cursor, rowid: int, en: str, ja: str):
-    cur.execute("DELETE FROM entries_fts WHERE rowid=?", (rowid,))
-    cur.execute("INSERT INTO entries_fts(rowid, en_text, ja_text) VALUES (?,?,?)", (rowid, en, ja))
-
 @app.get("/entry/{id}")
 def get_entry(id: int):
     with acquire_con() as con:
@@ -319,71 +1138,150 @@ def patch_entry(id: int, body: EntryUpdate):
 
     with acquire_con() as con:
         cur = con.cursor()
+        # FTS は entry_pairs_fts_au トリガで差し替え
         cur.execute(f"UPDATE entry_pairs SET {', '.join(fields)} WHERE id=?", (*params, id))
-        cur.execute("SELECT en_text, ja_text FROM entry_pairs WHERE id=?", (id,))
-        row = cur.fetchone()
-        if row:
-            _update_fts_for_id(cur, id, row["en_text"] or "", row["ja_text"] or "")
+        if body.en_text is not None or body.ja_text is not None:
+            cur.execute("SELECT en_text, ja_text FROM entry_pairs WHERE id=?", (id,))
+            r = cur.fetchone()
+            if r:
+                cur.execute("UPDATE entry_pairs SET en_norm=?, ja_norm=?, en_hash=? WHERE id=?",
+                            (*norm_keys(r["en_text"], r["ja_text"]), id))
         con.commit()
+        bump_data_generation()
         cur.execute("SELECT id, en_text, ja_text, source_name, priority FROM entry_pairs WHERE id=?", (id,))
         return dict(cur.fetchone())
 
-# ---------------- XML import (multipart) ----------------
 ID_KEYS = ("id", "contentuid", "contentuid_lc", "handle", "uid", "guid")
 TEXT_TAGS = ("string", "value", "text", "content", "_", "t", "v")
 
-def _extract_id_text_pairs(root: ET.Element) -> Tuple[int, Dict[str, str]]:
-    total = 0
-    pairs: Dict[str, str] = {}
-    for node in root.iter():
-        node_id = None
-        for k in ID_KEYS:
-            if k in node.attrib:
-                node_id = node.attrib[k]
-                break
-        if not node_id:
+# ---------------- streaming XML reader ----------------
+def _stream_elements(source, is_record: Callable[[ET.Element], bool]) -> Iterator[ET.Element]:
+    """iterparse で record 要素を閉じタグ時点で返し、処理済みの要素は順次捨てる。
+    record の内側は record が閉じるまで保持するので、子要素や itertext() はそのまま使える。"""
+    stack: List[Tuple[ET.Element, bool]] = []
+    open_records = 0
+    for event, el in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            rec = is_record(el)
+            stack.append((el, rec))
+            if rec:
+                open_records += 1
             continue
-        total += 1
+        _, rec = stack.pop()
+        if rec:
+            open_records -= 1
+            yield el
+        if open_records == 0:
+            # 外側に record が無ければ不要。親からも外して木が育たないようにする
+            el.clear()
+            if stack:
+                stack[-1][0].remove(el)
+
+class _XmlTextReader:
+    """UTF-8（不正バイトは置換）で読み、先頭の '<' より前（BOM やゴミ）を読み飛ばす iterparse 用リーダ"""
+    def __init__(self, raw):
+        self._text = io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+        self._started = False
+
+    def read(self, size: int = -1) -> str:
+        chunk = self._text.read(size)
+        while not self._started and chunk:
+            i = chunk.find("<")
+            if i >= 0:
+                self._started = True
+                return chunk[i:]
+            chunk = self._text.read(size)
+        return chunk
 
-        txt = (node.text or "").strip()
-        if not txt:
-            for tname in TEXT_TAGS:
-                child = node.find(tname)
-                if child is not None:
-                    c = (child.text or "").strip()
-                    if c:
-                        txt = c
-                        break
-        if not txt:
-            itxt = "".join(node.itertext()).strip()
-            if itxt:
-                txt = itxt
-
-        if txt != "":
-            pairs[node_id] = txt
-    return total, pairs
-
-def _upsert_xml_pair(cur: sqlite3.Cursor, source_name: str, entry_key: str,
-                     en_text: str, ja_text: str, priority: int) -> int:
-    # まず存在チェック
-    cur.execute(
-        "SELECT id FROM entry_pairs WHERE source_name=? AND entry_key=?",
-        (source_name, entry_key)
-    )
-    row = cur.fetchone()
-    if row:
-        rowid = int(row["id"])
-        cur.execute(
-            "UPDATE entry_pairs SET en_text=?, ja_text=?, priority=? WHERE id=?",
-            (en_text, ja_text, priority, rowid)
-        )
-    else:
-        cur.execute(
-            "INSERT INTO entry_pairs (en_text, ja_text, source_name, priority, entry_key) VALUES (?,?,?,?,?)",
-            (en_text, ja_text, source_name, priority, entry_key)
-        )
-        rowid = int(cur.lastrowid)
-    return rowid
+# ---------------- XML import (multipart) ----------------
+def _node_id(node: ET.Element) -> str:
+    for k in ID_KEYS:
+        if k in node.attrib:
+            return node.attrib[k]
+    return ""
+
+def _node_text(node: ET.Element) -> str:
+    txt = (node.text or "").strip()
+    if not txt:
+        for tname in TEXT_TAGS:
+            child = node.find(tname)
+            if child is not None:
+                c = (child.text or "").strip()
+                if c:
+                    txt = c
+                    break
+    if not txt:
+        itxt = "".join(node.itertext()).strip()
+        if itxt:
+            txt = itxt
+    return txt
+
+def _iter_id_text_pairs(source) -> Iterator[Tuple[str, str]]:
+    # ID 属性を持つノードごとに (id, 本文) を返す（本文が空でも返す）
+    for node in _stream_elements(source, lambda el: bool(_node_id(el))):
+        yield _node_id(node), _node_text(node)
+
+IMPORT_BATCH = 5000  # executemany 1回あたりの行数
+
+def _flush_staged(cur: sqlite3.Cursor, table: str, batch: List[Tuple[str, str]]):
+    # 正規化キーとハッシュはここで1回だけ計算して一緒に入れる
+    norms = normalize_batch([txt for _, txt in batch], normalize_match_key)
+    cur.executemany(f"INSERT OR REPLACE INTO temp.{table} VALUES (?,?,?,?)",
+                    [(k, txt, n, hash_text(n)) for (k, txt), n in zip(batch, norms)])
+    job_progress_add(rows_parsed=len(batch))
+
+def _stage_id_text_pairs(cur: sqlite3.Cursor, table: str, source) -> int:
+    # XML をストリームで読みながら一時テーブルへ流し込む。戻り値は ID 付きノード総数
+    total = 0
+    batch: List[Tuple[str, str]] = []
+    for node_id, txt in _iter_id_text_pairs(source):
+        total += 1
+        if txt == "":
+            continue
+        batch.append((node_id, txt))
+        if len(batch) >= IMPORT_BATCH:
+            _flush_staged(cur, table, batch)
+            batch.clear()
+    if batch:
+        _flush_staged(cur, table, batch)
+    return total
+
+@contextmanager
+def _xml_staging(cur: sqlite3.Cursor):
+    # 接続はプールで使い回すため、一時テーブルは必ず後始末する
+    for t in ("_stage_en", "_stage_ja"):
+        cur.execute(f"DROP TABLE IF EXISTS temp.{t}")
+        cur.execute(f"CREATE TEMP TABLE {t} (k TEXT PRIMARY KEY, text TEXT NOT NULL, norm TEXT NOT NULL, h TEXT NOT NULL)")
+    try:
+        yield
+    finally:
+        for t in ("_stage_en", "_stage_ja"):
+            cur.execute(f"DROP TABLE IF EXISTS temp.{t}")
+
+def _staged_key_diff(cur: sqlite3.Cursor, left: str, right: str, sample: int = 50) -> Tuple[int, List[str]]:
+    cur.execute(f"SELECT COUNT(*) AS c FROM temp.{left} WHERE k NOT IN (SELECT k FROM temp.{right})")
+    count = cur.fetchone()["c"]
+    cur.execute(f"SELECT k FROM temp.{left} WHERE k NOT IN (SELECT k FROM temp.{right}) ORDER BY k LIMIT ?", (sample,))
+    return count, [r["k"] for r in cur.fetchall()]
+
+def _merge_staged_xml_pairs(cur: sqlite3.Cursor, source_name: str, priority: int) -> int:
+    # EN/JA 共通キーを1文で entry_pairs へマージ（uq_source_entrykey 部分ユニークに対する UPSERT）
+    # 内容が同じ行は更新せず FTS トリガも発火させない
+    cur.execute("""
+        INSERT INTO entry_pairs (en_text, ja_text, source_name, priority, entry_key, en_norm, ja_norm, en_hash)
+        SELECT en.text, ja.text, ?, ?, 'xmlid:' || en.k, en.norm, ja.norm, en.h
+        FROM temp._stage_en en JOIN temp._stage_ja ja ON ja.k = en.k
+        WHERE true ORDER BY en.k
+        ON CONFLICT(source_name, entry_key) WHERE entry_key IS NOT NULL DO UPDATE SET
+            en_text=excluded.en_text, ja_text=excluded.ja_text, priority=excluded.priority,
+            en_norm=excluded.en_norm, ja_norm=excluded.ja_norm, en_hash=excluded.en_hash
+        WHERE en_text IS NOT excluded.en_text
+           OR ja_text IS NOT excluded.ja_text
+           OR priority IS NOT excluded.priority
+           OR en_hash IS NOT excluded.en_hash
+    """, (source_name, priority))
+    cur.execute("SELECT COUNT(*) AS c FROM temp._stage_en en JOIN temp._stage_ja ja ON ja.k = en.k")
+    return cur.fetchone()["c"]
 
 
 @app.post("/import/xml")
@@ -396,120 +1294,107 @@ async def import_xml(
     strict: bool = Form(True),
     replace_src: bool = Form(True)  # ← 同じ source_name は全削除してから入れ直す（上書き運用）
 ):
+    return await run_heavy("import", _import_xml_sync, enfile, jafile, src_en, src_ja, priority, strict, replace_src)
+
+def _import_xml_sync(enfile: UploadFile, jafile: UploadFile, src_en: str, src_ja: str,
+                     priority: int, strict: bool, replace_src: bool) -> Dict:
     source_name = f"XML:{src_en}|{src_ja}"
     print(f"[IMPORT/XML] recv en={enfile.filename} ja={jafile.filename} src_en={src_en} src_ja={src_ja} prio={priority} strict={strict} replace_src={replace_src}")
+    print(f"[IMPORT/XML] sizes: en={enfile.size} bytes, ja={jafile.size} bytes")
+    t0 = time.perf_counter()
 
-    en_bytes = await enfile.read()
-    ja_bytes = await jafile.read()
-    print(f"[IMPORT/XML] sizes: en={len(en_bytes)} bytes, ja={len(ja_bytes)} bytes")
-
-    try:
-        en_root = ET.parse(io.BytesIO(en_bytes)).getroot()
-        ja_root = ET.parse(io.BytesIO(ja_bytes)).getroot()
-    except Exception as e:
-        raise HTTPException(400, f"XML parse error: {e}")
-
-    en_total, en_map = _extract_id_text_pairs(en_root)
-    ja_total, ja_map = _extract_id_text_pairs(ja_root)
-
-    en_keys = set(en_map.keys())
-    ja_keys = set(ja_map.keys())
-    common_keys = en_keys & ja_keys
-
-    # 厳格チェック：キー集合が完全一致しないとエラー
-    if strict:
-        only_en = sorted(list(en_keys - ja_keys))
-        only_ja = sorted(list(ja_keys - en_keys))
-        if only_en or only_ja:
-            detail = {
-                "strict_mismatch": True, 
-                "en_total_nodes": en_total, "ja_total_nodes": ja_total,
-                "en_valid": len(en_map), "ja_valid": len(ja_map),
-                "common": len(common_keys),
-                "only_in_en_count": len(only_en),
-                "only_in_ja_count": len(only_ja),
-                "only_in_en_sample": only_en[:50],
-                "only_in_ja_sample": only_ja[:50],
-            }
-            print("[IMPORT/XML] strict mismatch:", detail)
-            # 400で詳細を返し、UIでそのまま表示できる
-            raise HTTPException(status_code=400, detail=detail)
-
-    inserted = 0
-    with acquire_con() as con:
+    with acquire_import_con() as con:
         cur = con.cursor()
-
-        # source名が同じ場合は全消し（上書き運用が既定）
-        if replace_src:
-            cur.execute("SELECT COUNT(*) AS c FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
-            prev = cur.fetchone()["c"]
-            if prev:
-                print(f"[IMPORT/XML] replace_src: delete old rows = {prev} (source={source_name})")
-                cur.execute("DELETE FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
-
-        # 共通キーだけ登録（strict=false時も安全策として共通のみ）
-        for k in sorted(common_keys):
-            en_text = en_map.get(k, "")
-            ja_text = ja_map.get(k, "")
-            entry_key = f"xmlid:{k}"  # 同一キー再取込で上書きされる
-            _upsert_xml_pair(cur, source_name, entry_key, en_text, ja_text, priority)
-            inserted += 1
-
-        # FTS再構築（大量時の同期待ち簡略化）
-        fts_rebuild(cur)
+        with _xml_staging(cur):
+            # アップロードは全読みせず、ストリームで解析しながら IMPORT_BATCH 行ずつ一時テーブルへ
+            try:
+                job_progress(phase="parse")
+                en_total = _stage_id_text_pairs(cur, "_stage_en", enfile.file)
+                ja_total = _stage_id_text_pairs(cur, "_stage_ja", jafile.file)
+            except ET.ParseError as e:
+                raise HTTPException(400, f"XML parse error: {e}")
+
+            cur.execute("SELECT (SELECT COUNT(*) FROM temp._stage_en) AS en, (SELECT COUNT(*) FROM temp._stage_ja) AS ja")
+            r = cur.fetchone()
+            en_valid, ja_valid = r["en"], r["ja"]
+            only_en_count, only_en = _staged_key_diff(cur, "_stage_en", "_stage_ja")
+            only_ja_count, only_ja = _staged_key_diff(cur, "_stage_ja", "_stage_en")
+            common = en_valid - only_en_count
+
+            # 厳格チェック：キー集合が完全一致しないとエラー
+            if strict and (only_en_count or only_ja_count):
+                detail = {
+                    "strict_mismatch": True,
+                    "en_total_nodes": en_total, "ja_total_nodes": ja_total,
+                    "en_valid": en_valid, "ja_valid": ja_valid,
+                    "common": common,
+                    "only_in_en_count": only_en_count,
+                    "only_in_ja_count": only_ja_count,
+                    "only_in_en_sample": only_en,
+                    "only_in_ja_sample": only_ja,
+                }
+                print("[IMPORT/XML] strict mismatch:", detail)
+                # 400で詳細を返し、UIでそのまま表示できる
+                raise HTTPException(status_code=400, detail=detail)
+
+            # source名が同じ場合は全消し（上書き運用が既定）
+            if replace_src:
+                cur.execute("SELECT COUNT(*) AS c FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
+                prev = cur.fetchone()["c"]
+                if prev:
+                    print(f"[IMPORT/XML] replace_src: delete old rows = {prev} (source={source_name})")
+                    cur.execute("DELETE FROM entry_pairs WHERE COALESCE(source_name,'')=?", (source_name,))
+
+            # 共通キーだけ登録（strict=false時も安全策として共通のみ）
+            # entry_key="xmlid:{id}" なので同一キー再取込で上書きされる
+            job_progress(phase="upsert")
+            inserted = _merge_staged_xml_pairs(cur, source_name, priority)
+            job_progress(rows_upserted=inserted)
+
+        # FTS はトリガで取り込み分だけ差分更新済み
         con.commit()
+    bump_data_generation()
 
-    print(f"[IMPORT/XML] inserted={inserted}")
+    elapsed = time.perf_counter() - t0
+    rows_per_sec = inserted / elapsed if elapsed > 0 else 0.0
+    print(f"[IMPORT/XML] inserted={inserted} elapsed={elapsed:.2f}s ({rows_per_sec:.0f} rows/s)")
     return {
         "inserted": inserted,
         "source_name": source_name,
         "strict": strict,
-        "EN_valid": len(en_map),
-        "JA_valid": len(ja_map),
-        "common": len(common_keys)
+        "EN_valid": en_valid,
+        "JA_valid": ja_valid,
+        "common": common,
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(rows_per_sec, 1),
     }
 
 
 # ---------------- BG3 Matcher (MOD↔公式 EN/JA 照合) ----------------
 
-def _normalize_text_bg3(s: str, aggressive: bool = True) -> str:
-    if s is None:
-        return ""
-    s = html.unescape(s)
-    s = re.sub(r"<\s*br\s*/?\s*>", " ", s, flags=re.IGNORECASE)
-    s = re.sub(r"<[^>]+>", "", s)
-    s = s.replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
-    s = re.sub(r"\s+", " ", s).strip()
-    if aggressive:
-        try:
-            import unicodedata
-            s = unicodedata.normalize("NFKC", s)
-        except Exception:
-            pass
-        s = s.strip(" .…")
-    return s
+# 正規化は importers/common.py と共通。MOD 行は同じ本文が何度も出る（照合キャッシュのハッシュ＋照合）のでメモ化する
+NORMALIZE_CACHE_SIZE = _env_int("TDB_NORMALIZE_CACHE", 65536)  # 0 で無効
+_match_key = memoized(normalize_match_key, NORMALIZE_CACHE_SIZE)
 
-def _read_xml_contents_from_text(text: str) -> List[Tuple[str, str, str]]:
-    try:
-        root = ET.fromstring(text)
-    except ET.ParseError:
-        cleaned = text[text.find("<"):]
-        root = ET.fromstring(cleaned)
-    rows: List[Tuple[str, str, str]] = []
-    for c in root.iter("content"):
+def _iter_xml_contents(raw) -> Iterator[Tuple[str, str, str]]:
+    # raw: バイナリファイル。<content> を1件ずつ (uid, version, 本文) で返す
+    for c in _stream_elements(_XmlTextReader(raw), lambda el: el.tag == "content"):
         uid = (c.attrib.get("contentuid", "") or "").strip()
         version = (c.attrib.get("version", "") or "1").strip()
-        raw = "".join(c.itertext())
-        rows.append((uid, version, raw))
-    return rows
+        raw_text = "".join(c.itertext())
+        yield uid, version, raw_text
+
+def _read_xml_contents(path: Path) -> List[Tuple[str, str, str]]:
+    with open(path, "rb") as raw:
+        return list(_iter_xml_contents(raw))
 
 def _build_official_indexes(off_en_rows: List[Tuple[str, str, str]],
                             off_ja_rows: List[Tuple[str, str, str]]
                             ) -> Tuple[Dict[str, List[str]], Dict[str, str], Dict[str, str]]:
     en_text_to_uids: Dict[str, List[str]] = {}
     en_uid_to_text: Dict[str, str] = {}
-    for uid, _ver, text in off_en_rows:
-        key = _normalize_text_bg3(text, aggressive=True)
+    keys = normalize_batch([text for _, _, text in off_en_rows], normalize_match_key)
+    for (uid, _ver, text), key in zip(off_en_rows, keys):
         if key:
             lst = en_text_to_uids.get(key)
             if lst is None:
@@ -525,13 +1410,127 @@ def _build_official_indexes(off_en_rows: List[Tuple[str, str, str]],
 
     return en_text_to_uids, ja_by_uid, en_uid_to_text
 
-def _build_length_buckets(keys: List[str]) -> Dict[int, List[str]]:
-    buckets: Dict[int, List[str]] = {}
-    for k in keys:
-        buckets.setdefault(len(k), []).append(k)
-    for L in list(buckets.keys()):
-        buckets[L].sort()
-    return buckets
+FUZZY_Q = 3  # n-gram 長
+
+def _qgrams(s: str) -> List[str]:
+    return [s[i:i + FUZZY_Q] for i in range(len(s) - FUZZY_Q + 1)]
+
+class _FuzzyIndex:
+    """文字 n-gram 転置索引による fuzzy 候補の絞り込み。
+    結果は difflib.get_close_matches(word, keys, n=1, cutoff) と同じ（取りこぼしの無い下限で候補を絞り、
+    最後は同じ SequenceMatcher の判定で検証する）。"""
+
+    def __init__(self, keys: List[str], postings: Optional[Dict[str, array]] = None):
+        # (長さ, 文字列) 順に並べるので、同じ長さのキーは kid の連続区間になる
+        self.keys = sorted(keys, key=lambda k: (len(k), k))
+        self.len_range: Dict[int, Tuple[int, int]] = {}
+        for kid, k in enumerate(self.keys):
+            lo, _ = self.len_range.get(len(k), (kid, kid))
+            self.len_range[len(k)] = (lo, kid + 1)
+        if postings is None:
+            postings = {}
+            for kid, k in enumerate(self.keys):
+                for g in set(_qgrams(k)):
+                    lst = postings.get(g)
+                    if lst is None:
+                        lst = postings[g] = array("i")
+                    lst.append(kid)  # kid 昇順で追加されるので各リストは整列済み
+        self.postings = postings
+
+    def to_payload(self) -> Dict[str, object]:
+        return {"keys": self.keys, "postings": self.postings}
+
+    @classmethod
+    def from_payload(cls, p: Dict) -> "_FuzzyIndex":
+        return cls(p["keys"], p["postings"])
+
+    def _candidate_lengths(self, la: int, cutoff: float) -> List[int]:
+        # 従来どおり ±2 文字の長さを対象、そこが空なら全長さ。さらに real_quick_ratio の上限で足切り
+        lengths = [la + d for d in (-2, -1, 0, 1, 2) if la + d in self.len_range]
+        if not lengths:
+            lengths = sorted(self.len_range)
+        return [lb for lb in lengths if 2.0 * min(la, lb) / (la + lb) >= cutoff]
+
+    @staticmethod
+    def _min_shared_grams(la: int, lb: int, cutoff: float) -> int:
+        # ratio >= cutoff なら LCS >= cutoff*(la+lb)/2 なので、挿入/削除の距離 d <= (1-cutoff)*(la+lb)。
+        # q-gram 補題より共有 q-gram 数（多重集合）は max(la,lb) - q + 1 - q*d 以上。
+        d = int((1.0 - cutoff) * (la + lb) + 1e-9)
+        return max(la, lb) - FUZZY_Q + 1 - FUZZY_Q * d
+
+    def best_match(self, word: str, cutoff: float) -> str:
+        if not 0.0 <= cutoff <= 1.0:
+            raise ValueError("cutoff must be in [0.0, 1.0]: %r" % (cutoff,))
+        la = len(word)
+        lengths = self._candidate_lengths(la, cutoff)
+        if not lengths:
+            return ""
+
+        grams_a: Dict[str, int] = {}
+        for g in _qgrams(word):
+            grams_a[g] = grams_a.get(g, 0) + 1
+        need = {lb: self._min_shared_grams(la, lb, cutoff) for lb in lengths}
+
+        cand: List[int] = []
+        filtered = [lb for lb in lengths if need[lb] > 0]
+        for lb in lengths:
+            if need[lb] <= 0:
+                # 短い文字列では n-gram で絞れないので、その長さは全件を検証する
+                lo, hi = self.len_range[lb]
+                cand.extend(range(lo, hi))
+        if filtered:
+            lo = min(self.len_range[lb][0] for lb in filtered)
+            hi = max(self.len_range[lb][1] for lb in filtered)
+            # 接頭辞フィルタ：出現の少ない n-gram から順に、残りの重み rest だけでは need に届かなくなるまで引く。
+            # 条件を満たす候補は必ずこの中のどれかを含み、共有量は (接頭辞での一致) + rest 以下。
+            items = sorted(grams_a.items(), key=lambda gc: len(self.postings.get(gc[0], ())))
+            rest = sum(grams_a.values())
+            need_min = min(need[lb] for lb in filtered)
+            hits: Counter = Counter()
+            probed = 0
+            for g, ca in items:
+                if rest < need_min:
+                    break
+                rest -= ca
+                probed += 1
+                post = self.postings.get(g)
+                if post:
+                    part = post[bisect_left(post, lo):bisect_left(post, hi)]
+                    for _ in range(ca):
+                        hits.update(part)
+            tail = items[probed:]
+            for kid, cnt in hits.items():
+                nb = need.get(len(self.keys[kid]), 0)
+                if nb <= 0 or cnt + rest < nb:
+                    continue
+                if cnt < nb:
+                    # 残りの n-gram を実際に数えて確定する（届いた/届かなくなった時点で打ち切り）
+                    x = self.keys[kid]
+                    left = rest
+                    for g, ca in tail:
+                        left -= ca
+                        if g in x:
+                            cnt += ca
+                            if cnt >= nb:
+                                break
+                        elif cnt + left < nb:
+                            break
+                    if cnt < nb:
+                        continue
+                cand.append(kid)
+
+        s = difflib.SequenceMatcher()
+        s.set_seq2(word)
+        best: Optional[Tuple[float, str]] = None
+        for kid in cand:
+            x = self.keys[kid]
+            s.set_seq1(x)
+            if s.real_quick_ratio() >= cutoff and s.quick_ratio() >= cutoff and s.ratio() >= cutoff:
+                # get_close_matches と同じく (score, 文字列) の最大を採用
+                sc = (s.ratio(), x)
+                if best is None or sc > best:
+                    best = sc
+        return best[1] if best else ""
 
 def _choose_uid_from_candidates(cands: List[str], ja_by_uid: Dict[str, str]) -> str:
     for uid in cands:
@@ -549,67 +1548,42 @@ def _choose_uid_for_text_exact(mod_key: str,
 def _choose_uid_for_text_fuzzy(mod_key: str,
                                en_text_to_uids: Dict[str, List[str]],
                                ja_by_uid: Dict[str, str],
-                               key_len_buckets: Dict[int, List[str]],
+                               fuzzy: _FuzzyIndex,
                                cutoff: float) -> Tuple[str, str]:
-    L = len(mod_key)
-    cand_keys: List[str] = []
-    for dL in (-2, -1, 0, 1, 2):
-        cand_keys.extend(key_len_buckets.get(L + dL, []))
-    if not cand_keys:
-        cand_keys = list(en_text_to_uids.keys())
-    near = difflib.get_close_matches(mod_key, cand_keys, n=1, cutoff=cutoff)
-    if near:
-        key = near[0]
+    key = fuzzy.best_match(mod_key, cutoff)
+    if key:
         return _choose_uid_from_candidates(en_text_to_uids.get(key, []), ja_by_uid), "fuzzy"
     return "", ""
 
-def _write_contentlist_xml_string(rows: List[Tuple[str, str, str]]) -> str:
-    root = ET.Element("contentList")
-    for uid, ver, text in rows:
-        el = ET.SubElement(root, "content", attrib={"contentuid": uid, "version": ver})
-        el.text = text if text is not None else ""
-    tree = ET.ElementTree(root)
-    try:
-        ET.indent(tree, space="  ", level=0)  # type: ignore[attr-defined]
-    except Exception:
-        pass
-    xml_bytes = ET.tostring(root, encoding="utf-8", xml_declaration=True)
-    return xml_bytes.decode("utf-8", errors="replace")
-
-def _write_contentlist_xml_sections_string(head_rows: List[Tuple[str, str, str]],
-                                           tail_rows: List[Tuple[str, str, str]],
-                                           tail_label: str = "") -> str:
-    root = ET.Element("contentList")
-    for uid, ver, text in head_rows:
-        el = ET.SubElement(root, "content", attrib={"contentuid": uid, "version": ver})
-        el.text = text if text is not None else ""
-    if tail_rows:
-        root.append(ET.Comment(f" {tail_label or 'JA missing (empty text)'} "))
-        for uid, ver, text in tail_rows:
-            el = ET.SubElement(root, "content", attrib={"contentuid": uid, "version": ver})
-            el.text = text if text is not None else ""
-    tree = ET.ElementTree(root)
-    try:
-        ET.indent(tree, space="  ", level=0)  # type: ignore[attr-defined]
-    except Exception:
-        pass
-    xml_bytes = ET.tostring(root, encoding="utf-8", xml_declaration=True)
-    return xml_bytes.decode("utf-8", errors="replace")
-
-def _write_review_csv_string(rows: List[Dict[str, str]]) -> str:
-    headers = [
-        "match_kind","mod_uid","mod_version","mod_text",
-        "official_en_uid","official_en_text","official_ja_text"
-    ]
-    buf = io.StringIO()
-    # BOM付き（Excel配慮）
-    buf.write("\ufeff")
-    import csv as _csv
-    w = _csv.DictWriter(buf, fieldnames=headers, extrasaction="ignore")
-    w.writeheader()
-    for r in rows:
-        w.writerow(r)
-    return buf.getvalue()
+def _content_element_xml(uid: str, ver: str, text: Optional[str]) -> str:
+    el = ET.Element("content", attrib={"contentuid": uid, "version": ver})
+    el.text = text if text is not None else ""
+    return ET.tostring(el, encoding="unicode")
+
+def _write_contentlist_xml_file(path: Path,
+                                head_rows: List[Tuple[str, str, str]],
+                                tail_rows: Optional[List[Tuple[str, str, str]]] = None,
+                                tail_label: str = "") -> int:
+    # ET.indent(space="  ") + tostring と同じ出力を、木を組まずに1行ずつファイルへ書く
+    with open(path, "w", encoding="utf-8", newline="") as out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        if not head_rows and not tail_rows:
+            out.write("<contentList />")
+            return 0
+        out.write("<contentList>")
+        for uid, ver, text in head_rows:
+            out.write("\n  " + _content_element_xml(uid, ver, text))
+        if tail_rows:
+            out.write(f"\n  <!-- {tail_label or 'JA missing (empty text)'} -->")
+            for uid, ver, text in tail_rows:
+                out.write("\n  " + _content_element_xml(uid, ver, text))
+        out.write("\n</contentList>")
+    return len(head_rows) + len(tail_rows or [])
+
+REVIEW_CSV_HEADERS = [
+    "match_kind","mod_uid","mod_version","mod_text",
+    "official_en_uid","official_en_text","official_ja_text"
+]
 
 def _iter_xml_files_under(dir_path: Path) -> List[Path]:
     if not dir_path.exists() or not dir_path.is_dir():
@@ -618,6 +1592,464 @@ def _iter_xml_files_under(dir_path: Path) -> List[Path]:
     files.sort(key=lambda p: str(p).lower())
     return files
 
+# ---------------- BG3 official index cache ----------------
+# 公式 EN/JA ディレクトリから作った照合用インデックスをメモリ（＋任意でディスク）にキャッシュする。
+# キーはディレクトリのパス、有効性は各ファイルの mtime/size（変化時は内容ハッシュで再確認）で判定。
+_INDEX_CACHE_DIR = Path("data/index_cache")
+INDEX_DISK_CACHE = os.environ.get("TDB_INDEX_DISK_CACHE", "1") != "0"
+INDEX_MEM_CACHE_MAX = 4
+INDEX_FORMAT = 2
+# 公式 XML の読み込み・パースの並列数（0 = CPU コア数）と方式（process / thread）
+INDEX_PARSE_WORKERS = _env_int("TDB_PARSE_WORKERS", 0)
+INDEX_PARSE_POOL = os.environ.get("TDB_PARSE_POOL", "process").strip().lower()
+
+FileStat = Tuple[str, int, int]  # (相対パス, mtime_ns, size)
+
+class _OfficialIndex:
+    def __init__(self, en_map: Dict[str, List[str]], ja_map: Dict[str, str], uid2en: Dict[str, str],
+                 en_count: int, ja_count: int, fingerprint: str = "",
+                 fuzzy: Optional[_FuzzyIndex] = None):
+        self.en_map = en_map
+        self.ja_map = ja_map
+        self.uid2en = uid2en
+        self.en_count = en_count
+        self.ja_count = ja_count
+        self.fingerprint = fingerprint
+        self._fuzzy = fuzzy
+        # fuzzy 索引を後から作った時にディスクへ書き戻すための保存先
+        self.disk_path: Optional[Path] = None
+        self.header: Optional[Dict[str, object]] = None
+        self._fuzzy_lock = threading.Lock()
+
+    def fuzzy(self) -> _FuzzyIndex:
+        # n-gram 索引は fuzzy を使う時だけ作る（作ったらキャッシュにも反映）
+        # 作成済みならロックを取らない。照合は行ごとに呼ぶので、直列照合のスレッドが握った瞬間に
+        # 並列照合が fork すると子プロセスに「握られたままのロック」が複製され、全ワーカーが止まる
+        fz = self._fuzzy
+        if fz is not None:
+            return fz
+        with self._fuzzy_lock:
+            if self._fuzzy is None:
+                t0 = time.perf_counter()
+                self._fuzzy = _FuzzyIndex(list(self.en_map.keys()))
+                print(f"[INDEX] fuzzy n-gram index built keys={len(self._fuzzy.keys)} ({time.perf_counter() - t0:.2f}s)")
+                if self.disk_path and self.header:
+                    _save_index_to_disk(self.disk_path, self.header, self)
+            return self._fuzzy
+
+    def to_payload(self) -> Dict[str, object]:
+        return {"en_map": self.en_map, "ja_map": self.ja_map, "uid2en": self.uid2en,
+                "en_count": self.en_count, "ja_count": self.ja_count, "fingerprint": self.fingerprint,
+                "fuzzy": self._fuzzy.to_payload() if self._fuzzy else None}
+
+    @classmethod
+    def from_payload(cls, p: Dict) -> "_OfficialIndex":
+        fz = _FuzzyIndex.from_payload(p["fuzzy"]) if p.get("fuzzy") else None
+        return cls(p["en_map"], p["ja_map"], p["uid2en"], p["en_count"], p["ja_count"], p.get("fingerprint", ""), fz)
+
+_index_mem_cache: "OrderedDict[Tuple[str, str], Tuple[Tuple[List[FileStat], List[FileStat]], _OfficialIndex]]" = OrderedDict()
+_index_lock = threading.Lock()  # キャッシュの参照・登録だけに使う（構築中は握らない）
+_index_build_locks: Dict[Tuple[str, str], threading.Lock] = {}  # 同じキーの構築を1回にまとめる
+
+def _dir_stats(base: Path) -> List[FileStat]:
+    out: List[FileStat] = []
+    for fp in _iter_xml_files_under(base):
+        try:
+            st = fp.stat()
+        except OSError:
+            continue
+        out.append((fp.relative_to(base).as_posix(), st.st_mtime_ns, st.st_size))
+    return out
+
+def _file_sha1(fp: Path) -> str:
+    with open(fp, "rb") as f:
+        return hashlib.file_digest(f, "sha1").hexdigest()
+
+def _stats_fingerprint(en_files: List[Tuple[str, str]], ja_files: List[Tuple[str, str]]) -> str:
+    # (相対パス, sha1) の一覧から公式コーパスの識別子を作る
+    h = hashlib.sha1()
+    for side, files in (("en", en_files), ("ja", ja_files)):
+        for rel, digest in files:
+            h.update(f"{side}\0{rel}\0{digest}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def _read_xml_contents_safe(path: Path) -> List[Tuple[str, str, str]]:
+    # 壊れたファイルは従来どおり読み飛ばす
+    try:
+        return _read_xml_contents(path)
+    except Exception:
+        return []
+
+def _read_xml_files(files: List[Path]) -> List[List[Tuple[str, str, str]]]:
+    # 戻り値は files と同じ順。ファイル単位でプールに投げて並列にパースする
+    workers = INDEX_PARSE_WORKERS or (os.cpu_count() or 1)
+    workers = max(1, min(workers, len(files)))
+    job_progress(phase="index", files_total=len(files), files_parsed=0)
+    if workers <= 1:
+        out = []
+        for fp in files:
+            out.append(_read_xml_contents_safe(fp))
+            job_progress_add(files_parsed=1)
+        return out
+    if INDEX_PARSE_POOL == "thread":
+        ex = ThreadPoolExecutor(max_workers=workers)
+    else:
+        ex = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context())
+    with ex:
+        out = []
+        for rows in ex.map(_read_xml_contents_safe, files):
+            out.append(rows)
+            job_progress_add(files_parsed=1)
+        return out
+
+def _build_official_index(base_en: Path, base_ja: Path) -> _OfficialIndex:
+    # EN/JA 両方のファイルをまとめて1つのプールで読み、元のファイル順で結合する
+    en_files, ja_files = _iter_xml_files_under(base_en), _iter_xml_files_under(base_ja)
+    parsed = _read_xml_files(en_files + ja_files)
+    en_rows = [row for rows in parsed[:len(en_files)] for row in rows]
+    ja_rows = [row for rows in parsed[len(en_files):] for row in rows]
+    en_map, ja_map, uid2en = _build_official_indexes(en_rows, ja_rows)
+    return _OfficialIndex(en_map, ja_map, uid2en, len(en_rows), len(ja_rows))
+
+def _index_disk_path(base_en: Path, base_ja: Path) -> Path:
+    key = hashlib.sha1(f"{base_en}\0{base_ja}".encode("utf-8")).hexdigest()[:20]
+    return _INDEX_CACHE_DIR / f"{key}.pickle"
+
+def _files_unchanged(base: Path, now: List[FileStat], saved: List[Tuple[str, int, int, str]]) -> bool:
+    # mtime/size が一致すれば同一とみなし、mtime だけ違う場合は内容ハッシュで確認する
+    if len(now) != len(saved):
+        return False
+    for (rel, mtime, size), (srel, smtime, ssize, sdigest) in zip(now, saved):
+        if rel != srel or size != ssize:
+            return False
+        if mtime != smtime and _file_sha1(base / rel) != sdigest:
+            return False
+    return True
+
+def _load_index_from_disk(path: Path, base_en: Path, base_ja: Path,
+                          en_stats: List[FileStat], ja_stats: List[FileStat]) -> Optional[_OfficialIndex]:
+    if not path.exists():
+        return None
+    try:
+        with open(path, "rb") as f:
+            header = pickle.load(f)  # 先頭はファイル一覧だけのヘッダ（本体は必要な時だけ読む）
+            if header.get("format") != INDEX_FORMAT:
+                return None
+            if header.get("en_dir") != str(base_en) or header.get("ja_dir") != str(base_ja):
+                return None
+            if not (_files_unchanged(base_en, en_stats, header["en_files"])
+                    and _files_unchanged(base_ja, ja_stats, header["ja_files"])):
+                return None
+            index = _OfficialIndex.from_payload(pickle.load(f))
+        index.disk_path, index.header = path, header
+        return index
+    except Exception as e:
+        print("[INDEX] disk cache load failed:", e)
+        return None
+
+def _save_index_to_disk(path: Path, header: Dict[str, object], index: _OfficialIndex):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(index.to_payload(), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        index.disk_path, index.header = path, header
+    except Exception as e:
+        print("[INDEX] disk cache save failed:", e)
+
+def _get_official_index(base_en: Path, base_ja: Path, refresh: bool = False,
+                        artifact: Optional[Path] = None) -> _OfficialIndex:
+    # artifact 指定時（バンドル）はその場所へ常に保存し、TDB_INDEX_DISK_CACHE に関係なく使う
+    key = (str(base_en), str(base_ja))
+    en_stats, ja_stats = _dir_stats(base_en), _dir_stats(base_ja)
+    with _index_lock:
+        hit = _index_mem_cache.get(key)
+        if hit and not refresh and hit[0] == (en_stats, ja_stats):
+            _index_mem_cache.move_to_end(key)
+            return hit[1]
+        seen = hit[1] if hit else None
+        build_lock = _index_build_locks.setdefault(key, threading.Lock())
+
+    # ハッシュ計算・パース・保存はキー単位のロックで行い、別キーのキャッシュヒットや DB 索引を待たせない
+    with build_lock:
+        with _index_lock:
+            # 待っている間に同じキーを作り終えていればそれを使う（refresh は自分が見た後に作られたものだけ）
+            hit = _index_mem_cache.get(key)
+            if hit and hit[0] == (en_stats, ja_stats) and (not refresh or hit[1] is not seen):
+                _index_mem_cache.move_to_end(key)
+                return hit[1]
+
+        t0 = time.perf_counter()
+        disk_path = artifact or _index_disk_path(base_en, base_ja)
+        use_disk = INDEX_DISK_CACHE or artifact is not None
+        index = None
+        if use_disk and not refresh:
+            index = _load_index_from_disk(disk_path, base_en, base_ja, en_stats, ja_stats)
+        if index is not None:
+            print(f"[INDEX] loaded from disk {disk_path.name} ({time.perf_counter() - t0:.2f}s)")
+        else:
+            en_files = [(rel, m, sz, _file_sha1(base_en / rel)) for rel, m, sz in en_stats]
+            ja_files = [(rel, m, sz, _file_sha1(base_ja / rel)) for rel, m, sz in ja_stats]
+            index = _build_official_index(base_en, base_ja)
+            index.fingerprint = _stats_fingerprint([(f[0], f[3]) for f in en_files], [(f[0], f[3]) for f in ja_files])
+            print(f"[INDEX] built en={index.en_count} ja={index.ja_count} keys={len(index.en_map)} ({time.perf_counter() - t0:.2f}s)")
+            if use_disk:
+                header = {"format": INDEX_FORMAT, "en_dir": str(base_en), "ja_dir": str(base_ja),
+                          "en_files": en_files, "ja_files": ja_files}
+                _save_index_to_disk(disk_path, header, index)
+
+        with _index_lock:
+            _index_mem_cache[key] = ((en_stats, ja_stats), index)
+            _index_mem_cache.move_to_end(key)
+            while len(_index_mem_cache) > INDEX_MEM_CACHE_MAX:
+                _index_mem_cache.popitem(last=False)
+        return index
+
+# ---------------- BG3 official index from DB ----------------
+# 取込済みの公式データ（entry_pairs の source_name）を照合相手にする。取込時に保存した en_norm/en_hash を使うので
+# XML の解析も正規化もしない。exact のみなら MOD 行のハッシュで ix_entry_en_hash を引き、該当行だけで索引を作る。
+_db_index_cache: "OrderedDict[Tuple[str, int], _OfficialIndex]" = OrderedDict()
+
+def _db_entry_uid(r: sqlite3.Row) -> str:
+    key = r["entry_key"] or ""
+    return key[len("xmlid:"):] if key.startswith("xmlid:") else f"id:{r['id']}"
+
+def _official_index_from_db_rows(rows: Iterator[sqlite3.Row], en_count: int, ja_count: int,
+                                 fingerprint: Optional[str] = "") -> _OfficialIndex:
+    # _build_official_indexes と同じ組み立て（キーは保存済みの en_norm）。fingerprint=None なら行内容から作る
+    en_map: Dict[str, List[str]] = {}
+    ja_map: Dict[str, str] = {}
+    uid2en: Dict[str, str] = {}
+    fp = hashlib.sha1() if fingerprint is None else None
+    for r in rows:
+        uid, key = _db_entry_uid(r), r["en_norm"]
+        if key:
+            lst = en_map.get(key)
+            if lst is None:
+                en_map[key] = [uid]
+            elif lst[-1] != uid:
+                lst.append(uid)
+        uid2en.setdefault(uid, r["en_text"])
+        if r["ja_text"]:
+            ja_map[uid] = r["ja_text"]
+        if fp is not None:
+            fp.update(f"{uid}\0{r['en_hash']}\0{r['ja_text'] or ''}\n".encode("utf-8"))
+    return _OfficialIndex(en_map, ja_map, uid2en, en_count, ja_count, fp.hexdigest() if fp else fingerprint)
+
+def _get_db_official_index(source_name: str, en_hashes: Optional[set] = None) -> _OfficialIndex:
+    # en_hashes 指定時はその行だけの部分索引（fingerprint は空 = 照合キャッシュは使わない）
+    gen = data_generation()
+    if en_hashes is None:
+        with _index_lock:
+            hit = _db_index_cache.get((source_name, gen))
+            if hit is not None:
+                _db_index_cache.move_to_end((source_name, gen))
+                return hit
+    t0 = time.perf_counter()
+    with acquire_con() as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT COUNT(*) AS en, COUNT(NULLIF(ja_text, '')) AS ja
+            FROM entry_pairs WHERE COALESCE(source_name,'')=?
+        """, (source_name,))
+        counts = cur.fetchone()
+        if not counts["en"]:
+            raise HTTPException(400, f"db_source has no rows: {source_name}")
+        cols = "id, entry_key, en_text, ja_text, en_norm, en_hash"
+        if en_hashes is None:
+            cur.execute(f"SELECT {cols} FROM entry_pairs WHERE COALESCE(source_name,'')=? ORDER BY id", (source_name,))
+            index = _official_index_from_db_rows(cur, counts["en"], counts["ja"], fingerprint=None)
+        else:
+            cur.execute("DROP TABLE IF EXISTS temp._match_hashes")
+            cur.execute("CREATE TEMP TABLE _match_hashes (h TEXT PRIMARY KEY)")
+            try:
+                cur.executemany("INSERT OR IGNORE INTO temp._match_hashes VALUES (?)", ((h,) for h in en_hashes))
+                cur.execute(f"""
+                    SELECT {cols} FROM entry_pairs
+                    WHERE en_hash IN (SELECT h FROM temp._match_hashes) AND COALESCE(source_name,'')=?
+                    ORDER BY id
+                """, (source_name,))
+                index = _official_index_from_db_rows(cur, counts["en"], counts["ja"])
+            finally:
+                cur.execute("DROP TABLE IF EXISTS temp._match_hashes")
+    print(f"[INDEX] from db source={source_name} keys={len(index.en_map)} partial={en_hashes is not None} ({time.perf_counter() - t0:.2f}s)")
+    if en_hashes is None:
+        with _index_lock:
+            _db_index_cache[(source_name, gen)] = index
+            while len(_db_index_cache) > INDEX_MEM_CACHE_MAX:
+                _db_index_cache.popitem(last=False)
+    return index
+
+# ---------------- BG3 match workers ----------------
+# fuzzy 照合は1行ごとに独立なので、MOD 行を分割してプロセスプールで並列処理する。
+# 公式インデックスは fork なら親のメモリを copy-on-write で共有、spawn ならキャッシュファイルから読む。
+MATCH_PARALLEL_MIN_ROWS = 2000  # これ未満はプロセス起動の方が高くつくので直列
+MATCH_CHUNKS_PER_WORKER = 4
+
+_worker_index: Optional[_OfficialIndex] = None
+
+def _match_line(mod_text: str, index: _OfficialIndex, enable_fuzzy: bool, cutoff: float) -> Tuple[str, str]:
+    mod_key = _match_key(mod_text)
+    chosen_uid, kind = _choose_uid_for_text_exact(mod_key, index.en_map, index.ja_map)
+    if not chosen_uid and enable_fuzzy and mod_key:
+        chosen_uid, kind = _choose_uid_for_text_fuzzy(mod_key, index.en_map, index.ja_map, index.fuzzy(), cutoff)
+    return chosen_uid, kind
+
+def _load_index_unchecked(path: Path) -> _OfficialIndex:
+    with open(path, "rb") as f:
+        pickle.load(f)  # ヘッダは読み飛ばす（親プロセスで検証済み）
+        return _OfficialIndex.from_payload(pickle.load(f))
+
+def _match_worker_init(index: Optional[_OfficialIndex], index_path: Optional[str]):
+    global _worker_index
+    _worker_index = index if index is not None else _load_index_unchecked(Path(index_path))
+
+def _match_chunk(args: Tuple[List[str], bool, float]) -> List[Tuple[str, str]]:
+    texts, enable_fuzzy, cutoff = args
+    return [_match_line(t, _worker_index, enable_fuzzy, cutoff) for t in texts]
+
+def _match_rows(texts: List[str], index: _OfficialIndex, enable_fuzzy: bool,
+                cutoff: float, workers: int) -> List[Tuple[str, str]]:
+    # 戻り値は texts と同じ順の (chosen_uid, kind)
+    workers = max(1, min(workers, os.cpu_count() or 1))
+    job_progress(phase="match", lines_total=len(texts), lines_matched=0)
+    if workers <= 1 or not enable_fuzzy or len(texts) < MATCH_PARALLEL_MIN_ROWS:
+        out = []
+        for i, t in enumerate(texts, 1):
+            out.append(_match_line(t, index, enable_fuzzy, cutoff))
+            if i % 100 == 0:
+                job_progress(lines_matched=i)
+        job_progress(lines_matched=len(texts))
+        return out
+
+    index.fuzzy()  # 子プロセスへ渡す前に n-gram 索引を用意（ディスクキャッシュにも書き戻される）
+    ctx = mp_context()
+    if ctx.get_start_method() == "fork":
+        initargs = (index, None)  # fork では引数は pickle されずにそのまま継承される
+    else:
+        initargs = (None, str(index.disk_path)) if index.disk_path else (index, None)
+
+    size = max(1, -(-len(texts) // (workers * MATCH_CHUNKS_PER_WORKER)))
+    chunks = [(texts[i:i + size], enable_fuzzy, cutoff) for i in range(0, len(texts), size)]
+    t0 = time.perf_counter()
+    out: List[Tuple[str, str]] = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_match_worker_init, initargs=initargs) as ex:
+        # map は投入順に結果を返すので、結合結果は元の MOD 行順のまま
+        for part in ex.map(_match_chunk, chunks):
+            out.extend(part)
+            job_progress(lines_matched=len(out))
+    print(f"[MATCH] parallel workers={workers} chunks={len(chunks)} rows={len(texts)} ({time.perf_counter() - t0:.2f}s)")
+    return out
+
+# ---------------- BG3 match decision cache ----------------
+# MOD を少し直して再照合する使い方が多いので、行ごとの照合結果を保存して変わった行だけ照合し直す。
+# キーは (公式コーパスの fingerprint, 照合条件, MOD uid, version, 正規化後テキストのハッシュ)。
+MATCH_CACHE_PATH = Path("data/index_cache/match_decisions.sqlite")
+MATCH_CACHE_ENABLED = os.environ.get("TDB_MATCH_CACHE", "1") != "0"
+MATCH_CACHE_MAX_ROWS = _env_int("TDB_MATCH_CACHE_ROWS", 1_000_000)  # 超えたら古い（最後に使った日時順）ものから削除
+MATCH_CACHE_VERSION = 1  # 正規化や照合の仕様を変えたら上げる（古い判定を使わないように）
+
+_match_cache_lock = threading.Lock()
+
+def _match_cache_con() -> sqlite3.Connection:
+    MATCH_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(MATCH_CACHE_PATH, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS decisions(
+          fingerprint TEXT NOT NULL,
+          mode TEXT NOT NULL,
+          mod_uid TEXT NOT NULL,
+          mod_version TEXT NOT NULL,
+          text_hash TEXT NOT NULL,
+          chosen_uid TEXT NOT NULL,
+          kind TEXT NOT NULL,
+          used_at INTEGER NOT NULL,
+          PRIMARY KEY(fingerprint, mode, mod_uid, mod_version, text_hash)
+        )
+    """)
+    con.execute("CREATE INDEX IF NOT EXISTS ix_decisions_used ON decisions(used_at)")
+    return con
+
+def _match_cache_mode(enable_fuzzy: bool, cutoff: float) -> str:
+    # fuzzy の有無と cutoff が違えば別の結果になるので別キー
+    return f"v{MATCH_CACHE_VERSION}:" + (f"fuzzy:{cutoff:g}" if enable_fuzzy else "exact")
+
+def _match_text_hash(mod_text: str) -> str:
+    return hashlib.sha1(_match_key(mod_text).encode("utf-8")).hexdigest()
+
+def _match_cache_lookup(fp: str, mode: str, keys: List[Tuple[str, str, str]], now: int) -> Dict[int, Tuple[str, str]]:
+    # 一時テーブルに今回のキーを入れて、保存済みの判定を1回の JOIN で引く（戻り値は 行番号 → (chosen_uid, kind)）
+    with _match_cache_lock:
+        con = _match_cache_con()
+        try:
+            con.execute("CREATE TEMP TABLE want(i INTEGER PRIMARY KEY, mod_uid TEXT, mod_version TEXT, text_hash TEXT)")
+            con.executemany("INSERT INTO want(i, mod_uid, mod_version, text_hash) VALUES (?,?,?,?)",
+                            ((i, u, v, h) for i, (u, v, h) in enumerate(keys)))
+            hits = {i: (chosen, kind) for i, chosen, kind in con.execute("""
+                SELECT w.i, d.chosen_uid, d.kind
+                FROM want w JOIN decisions d
+                  ON d.fingerprint = ? AND d.mode = ?
+                 AND d.mod_uid = w.mod_uid AND d.mod_version = w.mod_version AND d.text_hash = w.text_hash
+            """, (fp, mode))}
+            con.execute("""
+                UPDATE decisions SET used_at = ?
+                WHERE fingerprint = ? AND mode = ?
+                  AND (mod_uid, mod_version, text_hash) IN (SELECT mod_uid, mod_version, text_hash FROM want)
+            """, (now, fp, mode))
+            con.commit()
+            return hits
+        except Exception as e:
+            print("[MATCH] decision cache lookup failed:", e)
+            return {}
+        finally:
+            con.close()
+
+def _match_cache_store(fp: str, mode: str, rows: List[Tuple[Tuple[str, str, str], Tuple[str, str]]], now: int):
+    with _match_cache_lock:
+        con = _match_cache_con()
+        try:
+            con.executemany(
+                "INSERT OR REPLACE INTO decisions(fingerprint, mode, mod_uid, mod_version, text_hash, chosen_uid, kind, used_at) VALUES (?,?,?,?,?,?,?,?)",
+                ((fp, mode, uid, ver, h, chosen, kind or "", now) for (uid, ver, h), (chosen, kind) in rows))
+            total = con.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+            if MATCH_CACHE_MAX_ROWS > 0 and total > MATCH_CACHE_MAX_ROWS:
+                con.execute("DELETE FROM decisions WHERE rowid IN (SELECT rowid FROM decisions ORDER BY used_at LIMIT ?)",
+                            (total - MATCH_CACHE_MAX_ROWS,))
+            con.commit()
+        except Exception as e:
+            print("[MATCH] decision cache save failed:", e)
+        finally:
+            con.close()
+
+def _match_rows_cached(mod_rows: List[Tuple[str, str, str]], index: _OfficialIndex, enable_fuzzy: bool,
+                       cutoff: float, workers: int, reuse: bool = True) -> Tuple[List[Tuple[str, str]], int]:
+    # 戻り値は (mod_rows と同じ順の (chosen_uid, kind), キャッシュから再利用した行数)
+    # reuse=False でも照合し直した結果は保存する（キャッシュの作り直し）
+    if not (MATCH_CACHE_ENABLED and index.fingerprint and mod_rows):
+        return _match_rows([t for _, _, t in mod_rows], index, enable_fuzzy, cutoff, workers), 0
+
+    fp, mode = index.fingerprint, _match_cache_mode(enable_fuzzy, cutoff)
+    keys = [(uid, ver, _match_text_hash(text)) for uid, ver, text in mod_rows]
+    now = int(time.time())
+    hits = _match_cache_lookup(fp, mode, keys, now) if reuse else {}
+
+    miss = [i for i in range(len(mod_rows)) if i not in hits]
+    job_progress(lines_reused=len(hits))
+    fresh = _match_rows([mod_rows[i][2] for i in miss], index, enable_fuzzy, cutoff, workers) if miss else []
+    print(f"[MATCH] decision cache reused={len(hits)} matched={len(miss)}")
+
+    out: List[Tuple[str, str]] = [hits.get(i, ("", "")) for i in range(len(mod_rows))]
+    for i, decision in zip(miss, fresh):
+        out[i] = decision
+    if fresh:
+        _match_cache_store(fp, mode, [(keys[i], d) for i, d in zip(miss, fresh)], now)
+    return out, len(hits)
+
 def _safe_join(base: Path, relname: str) -> Path:
     # 相対パスを安全に連結（.. 無効化）
     rel = Path(relname).parts
@@ -642,12 +2074,30 @@ def _write_uploads_to_bundle(base: Path, subdir: str, files: List[UploadFile]) -
             print("[BUNDLES] save error:", e)
     return count
 
+BUNDLE_INDEX_NAME = "index.bin"
+
+def _bundle_dir(bundle_id: str) -> Path:
+    # bundle_id はディレクトリ名そのもの（パス区切りや .. は不可）
+    if not bundle_id or bundle_id != Path(bundle_id).name or bundle_id.startswith("."):
+        raise HTTPException(400, f"invalid bundle_id: {bundle_id}")
+    base = _BUNDLES_DIR / bundle_id
+    if not base.is_dir():
+        raise HTTPException(404, "bundle not found")
+    return base
+
+def _get_bundle_index(bundle_id: str, refresh: bool = False) -> _OfficialIndex:
+    base = _bundle_dir(bundle_id)
+    return _get_official_index(base / "en", base / "ja", refresh=refresh, artifact=base / BUNDLE_INDEX_NAME)
+
 @app.post("/bundles")
 async def create_bundle(
     enfiles: List[UploadFile] = File(...),
     jafiles: List[UploadFile] = File(...),
     label: str = Form("")
 ):
+    return await run_heavy("bundle", _create_bundle_sync, enfiles, jafiles, label)
+
+def _create_bundle_sync(enfiles: List[UploadFile], jafiles: List[UploadFile], label: str) -> Dict:
     ts = time.strftime("%Y%m%d-%H%M%S")
     nid = f"b{ts}-{int(time.time()*1000)%100000}"
     base = _BUNDLES_DIR / nid
@@ -667,7 +2117,15 @@ async def create_bundle(
     except Exception as e:
         print("[BUNDLES] meta write failed:", e)
 
-    return {"id": nid, "label": meta["label"], "en_files": en_count, "ja_files": ja_count}
+    # 照合用インデックスを事前構築して index.bin に保存（失敗しても照合時に作り直せる）
+    index_info = None
+    try:
+        index = _get_bundle_index(nid)
+        index_info = {"keys": len(index.en_map), "en": index.en_count, "ja": index.ja_count}
+    except Exception as e:
+        print("[BUNDLES] index build failed:", e)
+
+    return {"id": nid, "label": meta["label"], "en_files": en_count, "ja_files": ja_count, "index": index_info}
 
 @app.get("/bundles")
 def list_bundles():
@@ -687,7 +2145,8 @@ def list_bundles():
             pass
         en_files = len(_iter_xml_files_under(d / "en"))
         ja_files = len(_iter_xml_files_under(d / "ja"))
-        out.append({"id": meta.get("id", d.name), "label": meta.get("label", ""), "created_at": meta.get("created_at", 0), "en_files": en_files, "ja_files": ja_files})
+        indexed = (d / BUNDLE_INDEX_NAME).exists()
+        out.append({"id": meta.get("id", d.name), "label": meta.get("label", ""), "created_at": meta.get("created_at", 0), "en_files": en_files, "ja_files": ja_files, "indexed": indexed})
     return {"bundles": out}
 
 @app.delete("/bundles/{bundle_id}")
@@ -704,20 +2163,25 @@ def delete_bundle(bundle_id: str):
 @app.post("/match/bg3")
 async def match_bg3(
     modfile: UploadFile = File(...),
-    en_dir: str = Form(...),
-    ja_dir: str = Form(...),
+    en_dir: str = Form(""),
+    ja_dir: str = Form(""),
     enable_fuzzy: bool = Form(False),
     cutoff: float = Form(0.92),
     workers: int = Form(1),
-    base_dir: str = Form("")
+    base_dir: str = Form(""),
+    refresh_index: bool = Form(False),  # ← True で公式インデックスのキャッシュを使わず作り直す
+    bundle_id: str = Form(""),  # ← 指定時は en_dir/ja_dir の代わりにバンドルの事前構築インデックスを使う
+    rematch: bool = Form(False),  # ← True で前回の照合結果を使わず全行を照合し直す
+    db_source: str = Form("")  # ← 指定時は取込済みの公式データ（この source_name の行）と照合する
 ):
-    # 読み込み
-    mod_bytes = await modfile.read()
-    mod_text = mod_bytes.decode("utf-8", errors="replace")
-    mod_rows = _read_xml_contents_from_text(mod_text)
+    return await run_heavy("match", _match_bg3_sync, modfile, en_dir, ja_dir, enable_fuzzy, cutoff,
+                           workers, base_dir, refresh_index, bundle_id, rematch, db_source)
 
-    en_rows: List[Tuple[str, str, str]] = []
-    ja_rows: List[Tuple[str, str, str]] = []
+def _match_bg3_sync(modfile: UploadFile, en_dir: str, ja_dir: str, enable_fuzzy: bool, cutoff: float,
+                    workers: int, base_dir: str, refresh_index: bool, bundle_id: str,
+                    rematch: bool = False, db_source: str = "") -> Dict:
+    # 読み込み
+    mod_rows = list(_iter_xml_contents(modfile.file))
 
     # 相対ディレクトリ解決（base_dir が指定されていればそれ基準）
     def _resolve_dir(p: str) -> Path:
@@ -731,83 +2195,341 @@ async def match_bg3(
                 return raw.resolve()
         return raw.resolve()
 
-    base_en = _resolve_dir(en_dir)
-    base_ja = _resolve_dir(ja_dir)
-    if not base_en.exists() or not base_en.is_dir():
-        raise HTTPException(400, f"en_dir invalid: {en_dir}")
-    if not base_ja.exists() or not base_ja.is_dir():
-        raise HTTPException(400, f"ja_dir invalid: {ja_dir}")
-    for fp in _iter_xml_files_under(base_en):
-        try:
-            txt = fp.read_text(encoding="utf-8", errors="replace")
-            en_rows.extend(_read_xml_contents_from_text(txt))
-        except Exception:
-            continue
-    for fp in _iter_xml_files_under(base_ja):
-        try:
-            txt = fp.read_text(encoding="utf-8", errors="replace")
-            ja_rows.extend(_read_xml_contents_from_text(txt))
-        except Exception:
-            continue
-
-    en_map, ja_map, uid2en = _build_official_indexes(en_rows, ja_rows)
-    buckets = _build_length_buckets(list(en_map.keys()))
+    if db_source:
+        # exact のみなら MOD 行に一致し得る行だけを索引で引く
+        hashes = None if enable_fuzzy else {hash_text(_match_key(t)) for _, _, t in mod_rows}
+        index = _get_db_official_index(db_source, hashes)
+    elif bundle_id:
+        index = _get_bundle_index(bundle_id, refresh=refresh_index)
+    else:
+        if not en_dir or not ja_dir:
+            raise HTTPException(400, "en_dir and ja_dir (or bundle_id / db_source) are required")
+        base_en = _resolve_dir(en_dir)
+        base_ja = _resolve_dir(ja_dir)
+        if not base_en.exists() or not base_en.is_dir():
+            raise HTTPException(400, f"en_dir invalid: {en_dir}")
+        if not base_ja.exists() or not base_ja.is_dir():
+            raise HTTPException(400, f"ja_dir invalid: {ja_dir}")
+        index = _get_official_index(base_en, base_ja, refresh=refresh_index)
+    ja_map, uid2en = index.ja_map, index.uid2en
 
     matched_ja: List[Tuple[str, str, str]] = []
     matched_noja: List[Tuple[str, str, str]] = []
     unmatched_src: List[Tuple[str, str, str]] = []
-    review_rows: List[Dict[str, str]] = []
-
-    for uid, ver, mod_text in mod_rows:
-        mod_key = _normalize_text_bg3(mod_text, aggressive=True)
-        chosen_uid, kind = _choose_uid_for_text_exact(mod_key, en_map, ja_map)
-        if not chosen_uid and enable_fuzzy and mod_key:
-            chosen_uid, kind = _choose_uid_for_text_fuzzy(mod_key, en_map, ja_map, buckets, cutoff)
-
-        if chosen_uid:
-            ja_text = ja_map.get(chosen_uid, "")
-            en_text = uid2en.get(chosen_uid, "")
-            if ja_text:
-                matched_ja.append((uid, ver, ja_text))
-            else:
-                matched_noja.append((uid, ver, ""))
-            review_rows.append({
-                "match_kind": kind or "none",
-                "mod_uid": uid,
-                "mod_version": ver,
-                "mod_text": mod_text,
-                "official_en_uid": chosen_uid,
-                "official_en_text": en_text,
-                "official_ja_text": ja_text,
-            })
-        else:
-            unmatched_src.append((uid, ver, mod_text))
-
-    # 並列時の安全対策（単一スレッドでも影響なし）
-    en_matched_mod_uids = {r["mod_uid"] for r in review_rows if r.get("official_en_uid")}
-    clean_unmatched = [(u, v, t) for (u, v, t) in unmatched_src if u not in en_matched_mod_uids]
+    en_matched_mod_uids = set()
+    review_count = 0
 
-    matched_xml = _write_contentlist_xml_sections_string(matched_ja, matched_noja, "JA missing (empty text)")
-    matched_ja_xml = _write_contentlist_xml_string(matched_ja)
-    unmatched_xml = _write_contentlist_xml_string(clean_unmatched)
-    review_csv = _write_review_csv_string(review_rows) if enable_fuzzy else None
-
-    resp = {
-        "counts": {
+    decisions, reused = _match_rows_cached(mod_rows, index, enable_fuzzy, cutoff, workers, reuse=not rematch)
+    job_progress(phase="write")
+    rid, work = _new_match_result()
+    try:
+        # review CSV は照合結果を回しながらそのまま書き出す（BOM付き：Excel配慮）
+        review_f = open(work / MATCH_ARTIFACTS["review_csv"][0], "w", encoding="utf-8", newline="") if enable_fuzzy else None
+        try:
+            review_w = None
+            if review_f is not None:
+                review_f.write("\ufeff")
+                import csv as _csv
+                review_w = _csv.writer(review_f)
+                review_w.writerow(REVIEW_CSV_HEADERS)
+            for (uid, ver, mod_text), (chosen_uid, kind) in zip(mod_rows, decisions):
+                if chosen_uid:
+                    ja_text = ja_map.get(chosen_uid, "")
+                    if ja_text:
+                        matched_ja.append((uid, ver, ja_text))
+                    else:
+                        matched_noja.append((uid, ver, ""))
+                    en_matched_mod_uids.add(uid)
+                    review_count += 1
+                    if review_w is not None:
+                        review_w.writerow([kind or "none", uid, ver, mod_text,
+                                           chosen_uid, uid2en.get(chosen_uid, ""), ja_text])
+                else:
+                    unmatched_src.append((uid, ver, mod_text))
+        finally:
+            if review_f is not None:
+                review_f.close()
+
+        # 並列時の安全対策（単一スレッドでも影響なし）
+        clean_unmatched = [(u, v, t) for (u, v, t) in unmatched_src if u not in en_matched_mod_uids]
+
+        _write_contentlist_xml_file(work / MATCH_ARTIFACTS["matched_xml"][0], matched_ja, matched_noja, "JA missing (empty text)")
+        _write_contentlist_xml_file(work / MATCH_ARTIFACTS["matched_ja_xml"][0], matched_ja)
+        _write_contentlist_xml_file(work / MATCH_ARTIFACTS["unmatched_xml"][0], clean_unmatched)
+
+        counts = {
             "mod": len(mod_rows),
-            "en": len(en_rows),
-            "ja": len(ja_rows),
+            "en": index.en_count,
+            "ja": index.ja_count,
             "matched_ja": len(matched_ja),
             "matched_noja": len(matched_noja),
             "unmatched": len(clean_unmatched),
-            "review_rows": len(review_rows),
-        },
-        "matched_xml": matched_xml,
-        "matched_ja_xml": matched_ja_xml,
-        "unmatched_xml": unmatched_xml,
-        "review_csv": review_csv,
-    }
-    return resp
+            "review_rows": review_count,
+            "reused": reused,
+        }
+        params = {"mod": modfile.filename or "", "en_dir": en_dir, "ja_dir": ja_dir, "bundle_id": bundle_id,
+                  "db_source": db_source, "enable_fuzzy": enable_fuzzy, "cutoff": cutoff}
+        meta = _finish_match_result(rid, work, counts, params)
+    except Exception:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    return {"counts": counts, "result_id": rid, "artifacts": meta["artifacts"]}
+
+
+# ---------------- match results (artifacts) ----------------
+# 照合結果は data/results/<result_id>/ にファイルとして一度だけ書き、種類ごとに個別にダウンロードさせる
+# （JSON に巨大な XML 文字列を詰めない）。古いものから MATCH_RESULTS_KEEP 件を超えた分を削除。
+MATCH_RESULTS_KEEP = _env_int("TDB_MATCH_RESULTS_KEEP", 20)  # 0 以下で無制限
+_MATCH_RESULTS_DIR = Path("data/results")
+# 種類 → (保存ファイル名, Content-Type, ダウンロード名)
+MATCH_ARTIFACTS = {
+    "matched_xml": ("matched.xml", "application/xml", "bg3_out_matched_ja.xml"),
+    "matched_ja_xml": ("matched_ja.xml", "application/xml", "bg3_out_matched_ja_only.xml"),
+    "unmatched_xml": ("unmatched.xml", "application/xml", "bg3_out_unmatched_src.xml"),
+    "review_csv": ("review.csv", "text/csv", "bg3_review_pairs.csv"),
+}
+
+def _new_match_result() -> Tuple[str, Path]:
+    rid = f"r{int(time.time() * 1000):x}{os.urandom(3).hex()}"
+    # 書き終わるまでは .tmp に置き、一覧やダウンロードから見えないようにする
+    work = _MATCH_RESULTS_DIR / f"{rid}.tmp"
+    work.mkdir(parents=True, exist_ok=True)
+    return rid, work
+
+def _finish_match_result(rid: str, work: Path, counts: Dict, params: Dict) -> Dict:
+    artifacts = {}
+    for kind, (fname, _, _) in MATCH_ARTIFACTS.items():
+        fp = work / fname
+        if fp.exists():
+            artifacts[kind] = {"url": f"/match/results/{rid}/{kind}", "size": fp.stat().st_size}
+    meta = {"id": rid, "created_at": int(time.time()), "counts": counts, "params": params, "artifacts": artifacts}
+    (work / "meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    work.rename(_MATCH_RESULTS_DIR / rid)
+    _prune_match_results()
+    return meta
+
+def _prune_match_results():
+    if MATCH_RESULTS_KEEP <= 0:
+        return
+    try:
+        dirs = sorted((d for d in _MATCH_RESULTS_DIR.iterdir() if d.is_dir() and not d.name.endswith(".tmp")),
+                      key=lambda d: d.name)
+    except FileNotFoundError:
+        return
+    for d in dirs[:max(0, len(dirs) - MATCH_RESULTS_KEEP)]:
+        shutil.rmtree(d, ignore_errors=True)
+
+def _match_result_dir(result_id: str) -> Path:
+    if not re.fullmatch(r"r[0-9a-f]+", result_id or ""):
+        raise HTTPException(400, f"invalid result_id: {result_id}")
+    base = _MATCH_RESULTS_DIR / result_id
+    if not base.is_dir():
+        raise HTTPException(404, "result not found")
+    return base
+
+def _read_match_result_meta(base: Path) -> Dict:
+    try:
+        return json.loads((base / "meta.json").read_text(encoding="utf-8"))
+    except Exception:
+        return {"id": base.name, "created_at": 0, "counts": {}, "params": {}, "artifacts": {}}
+
+@app.get("/match/results")
+def list_match_results():
+    out = []
+    if _MATCH_RESULTS_DIR.exists():
+        for d in sorted(_MATCH_RESULTS_DIR.iterdir(), key=lambda p: p.name, reverse=True):
+            if d.is_dir() and not d.name.endswith(".tmp"):
+                out.append(_read_match_result_meta(d))
+    return {"results": out}
+
+@app.get("/match/results/{result_id}")
+def get_match_result(result_id: str):
+    return _read_match_result_meta(_match_result_dir(result_id))
+
+@app.get("/match/results/{result_id}/{kind}")
+def download_match_artifact(result_id: str, kind: str):
+    base = _match_result_dir(result_id)
+    if kind not in MATCH_ARTIFACTS:
+        raise HTTPException(404, f"unknown artifact: {kind}")
+    fname, media_type, download_name = MATCH_ARTIFACTS[kind]
+    fp = base / fname
+    if not fp.is_file():
+        raise HTTPException(404, "artifact not available (review_csv requires enable_fuzzy)" if kind == "review_csv" else "artifact not found")
+    return FileResponse(fp, media_type=f"{media_type}; charset=utf-8", filename=download_name)
+
+@app.delete("/match/results/{result_id}")
+def delete_match_result(result_id: str):
+    base = _match_result_dir(result_id)
+    shutil.rmtree(base, ignore_errors=True)
+    return {"deleted": result_id}
+
+
+# ---------------- background jobs ----------------
+# 大きな取込・照合はジョブとして受け付け、job_id で進捗と結果を取りに来てもらう（UI を再読み込みしても続行）。
+# 実行は run_heavy 経由なので同時実行数の制限は通常の API と共通。
+JOBS_KEEP = _env_int("TDB_JOBS_KEEP", 50)  # 保持する終了済みジョブ数（古いものから破棄）
+_JOBS_DIR = Path("data/jobs")
+
+class _Job:
+    def __init__(self, kind: str, params: Dict[str, object]):
+        self.id = f"j{int(time.time() * 1000):x}{os.urandom(3).hex()}"
+        self.kind = kind
+        self.params = params
+        self.status = "queued"  # queued / running / done / error
+        self.progress: Dict[str, object] = {}
+        self.result: Optional[Dict] = None
+        self.error: object = None
+        self.error_status = 500
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            self.progress.update(fields)
+
+    def add(self, **deltas):
+        with self._lock:
+            for k, v in deltas.items():
+                self.progress[k] = self.progress.get(k, 0) + v
+
+    def to_dict(self) -> Dict[str, object]:
+        with self._lock:
+            progress = dict(self.progress)
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        done_rows = progress.get("lines_matched") or progress.get("rows_upserted") or progress.get("rows_parsed") or 0
+        progress["rows_per_sec"] = round(done_rows / elapsed, 1) if elapsed > 0 else 0.0
+        return {"id": self.id, "kind": self.kind, "status": self.status, "params": self.params,
+                "progress": progress, "error": self.error,
+                "created_at": self.created_at, "elapsed_sec": round(elapsed, 3)}
+
+_jobs: "OrderedDict[str, _Job]" = OrderedDict()
+_jobs_lock = threading.Lock()
+_job_tasks: set = set()
+
+def _get_job(job_id: str) -> _Job:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "job not found")
+    return job
+
+def _prune_jobs():
+    with _jobs_lock:
+        finished = [j for j in _jobs.values() if j.status in ("done", "error")]
+        for j in finished[:max(0, len(finished) - JOBS_KEEP)]:
+            del _jobs[j.id]
+
+def _spool_upload(job: _Job, upload: UploadFile, name: str) -> Path:
+    # アップロードはリクエスト終了で閉じられるため、ジョブ用に保存しておく
+    dest = _JOBS_DIR / job.id / name
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    with open(dest, "wb") as out:
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return dest
+
+def _job_body(job: _Job, fn: Callable, uploads: Dict[str, Tuple[Path, str]], kwargs: Dict[str, object]):
+    _job_local.job = job
+    job.status, job.started_at = "running", time.time()
+    files = {}
+    try:
+        for arg, (path, filename) in uploads.items():
+            files[arg] = UploadFile(open(path, "rb"), filename=filename, size=path.stat().st_size)
+        job.result = fn(**files, **kwargs)
+        job.status = "done"
+    except HTTPException as e:
+        job.status, job.error, job.error_status = "error", e.detail, e.status_code
+    except Exception as e:
+        print(f"[JOB] {job.id} failed:", e)
+        job.status, job.error = "error", str(e)
+    finally:
+        _job_local.job = None
+        job.finished_at = time.time()
+        for f in files.values():
+            f.file.close()
+        shutil.rmtree(_JOBS_DIR / job.id, ignore_errors=True)
+        print(f"[JOB] {job.id} {job.kind} {job.status} ({job.finished_at - job.started_at:.2f}s)")
+        _prune_jobs()
+
+async def _submit_job(kind: str, fn: Callable, uploads: Dict[str, UploadFile], kwargs: Dict[str, object]) -> Dict:
+    job = _Job(kind, {k: v for k, v in kwargs.items()})
+    spooled = {}
+    for arg, up in uploads.items():
+        path = await asyncio.to_thread(_spool_upload, job, up, arg)
+        spooled[arg] = (path, up.filename or arg)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    task = asyncio.create_task(run_heavy(kind, _job_body, job, fn, spooled, kwargs))
+    _job_tasks.add(task)
+    task.add_done_callback(_job_tasks.discard)
+    print(f"[JOB] {job.id} {kind} queued")
+    return {"job_id": job.id, "status": job.status}
+
+@app.post("/jobs/import/xml")
+async def submit_import_job(
+    enfile: UploadFile = File(...),
+    jafile: UploadFile = File(...),
+    src_en: str = Form("Loca EN"),
+    src_ja: str = Form("Loca JP"),
+    priority: int = Form(100),
+    strict: bool = Form(True),
+    replace_src: bool = Form(True)
+):
+    # /import/xml と同じ処理をジョブとして実行
+    return await _submit_job("import", _import_xml_sync, {"enfile": enfile, "jafile": jafile},
+                             {"src_en": src_en, "src_ja": src_ja, "priority": priority,
+                              "strict": strict, "replace_src": replace_src})
+
+@app.post("/jobs/match/bg3")
+async def submit_match_job(
+    modfile: UploadFile = File(...),
+    en_dir: str = Form(""),
+    ja_dir: str = Form(""),
+    enable_fuzzy: bool = Form(False),
+    cutoff: float = Form(0.92),
+    workers: int = Form(1),
+    base_dir: str = Form(""),
+    refresh_index: bool = Form(False),
+    bundle_id: str = Form(""),
+    rematch: bool = Form(False),
+    db_source: str = Form("")
+):
+    # /match/bg3 と同じ処理をジョブとして実行
+    return await _submit_job("match", _match_bg3_sync, {"modfile": modfile},
+                             {"en_dir": en_dir, "ja_dir": ja_dir, "enable_fuzzy": enable_fuzzy,
+                              "cutoff": cutoff, "workers": workers, "base_dir": base_dir,
+                              "refresh_index": refresh_index, "bundle_id": bundle_id, "rematch": rematch,
+                              "db_source": db_source})
+
+@app.get("/jobs")
+def list_jobs():
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    return {"jobs": [j.to_dict() for j in reversed(jobs)]}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    return _get_job(job_id).to_dict()
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = _get_job(job_id)
+    if job.status == "error":
+        raise HTTPException(job.error_status, job.error)
+    if job.status != "done":
+        raise HTTPException(409, f"job is {job.status}")
+    return job.result
+
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    job = _get_job(job_id)
+    if job.status not in ("done", "error"):
+        raise HTTPException(409, "job is still running")
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+    return {"deleted": job_id}
 
 
 # ---------------- Local directory picker (desktop only) ----------------
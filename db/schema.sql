@@ -4,9 +4,19 @@ CREATE TABLE entry_pairs (
     en_text TEXT NOT NULL,
     ja_text TEXT,
     source_name TEXT,
-    priority INTEGER DEFAULT 100
+    priority INTEGER DEFAULT 100,
+    entry_key TEXT,
+    en_norm TEXT,   -- 正規化済み EN（実体参照・タグ除去、空白畳み、NFKC。BG3 照合と同じ）
+    ja_norm TEXT,   -- 正規化済み JA
+    en_hash TEXT    -- en_norm の SHA-1
 );
 
+-- 大小無視の完全一致用（LOWER(en_text) = LOWER(?) と source/priority 条件を索引で引く）
+CREATE INDEX ix_entry_en_lower ON entry_pairs(LOWER(en_text), COALESCE(source_name,''), priority);
+
+-- 正規化キーのハッシュで引く（DB 上の公式データとの照合）
+CREATE INDEX ix_entry_en_hash ON entry_pairs(en_hash, COALESCE(source_name,''));
+
 -- FTS5 インデックス（全文検索用）
 CREATE VIRTUAL TABLE entries_fts USING fts5(
     en_text, ja_text, content='entry_pairs', content_rowid='id'
@@ -1,18 +1,82 @@
-import re, hashlib
+import re, sys, hashlib, unicodedata
+import multiprocessing as mp
+from functools import lru_cache
 from html import unescape
+from typing import Callable, Iterable, List
 
+# 正規化はここに集約する（importers / api の照合 / tools/dump.py で共通）。
+# 正規表現は事前コンパイルし、ASCII だけの文字列は NFKC などを省略する（結果は同じ）。
 TAG_RE = re.compile(r"<[^>]+>")
 SPACE_RE = re.compile(r"\s+")
+BR_RE = re.compile(r"<\s*br\s*/?\s*>", re.IGNORECASE)
+
+# 用語照会用：NFKC 後に残る全角記号・長音のゆれを寄せる
+_TERM_TABLE = str.maketrans({"，":"、","．":"。","･":"・","ｰ":"ー","－":"ー","—":"ー","―":"ー","〜":"～","～":"～"})
+_EN_PUNCT_TABLE = str.maketrans({"’": "'", "–": "-", "—": "-"})
+
+def _collapse_spaces(s: str) -> str:
+    # re.sub(r"\s+", " ", s).strip() と同じ（空白の判定は str.isspace と共通）
+    return " ".join(s.split())
 
 def normalize_plain(text: str, lang: str) -> str:
     if text is None:
         return ''
-    t = unescape(text)
-    t = TAG_RE.sub(' ', t)
-    t = SPACE_RE.sub(' ', t).strip()
+    t = unescape(text) if "&" in text else text
+    if "<" in t:
+        t = TAG_RE.sub(' ', t)
+    t = _collapse_spaces(t)
     if lang == 'en':
-        t = t.lower().replace('’', "'").replace('–', '-').replace('—', '-')
+        t = t.lower().translate(_EN_PUNCT_TABLE)
     return t
 
+def normalize_match_key(text: str, aggressive: bool = True) -> str:
+    # BG3 照合のキー：実体参照を戻し、<br> は空白、その他のタグは除去して空白を畳む
+    if text is None:
+        return ""
+    s = unescape(text) if "&" in text else text
+    if "<" in s:
+        s = BR_RE.sub(" ", s)
+        s = TAG_RE.sub("", s)
+    s = _collapse_spaces(s)
+    if aggressive:
+        if not s.isascii():
+            s = unicodedata.normalize("NFKC", s)
+        s = s.strip(" .…")
+    return s
+
+def normalize_term(text: str) -> str:
+    # 用語リスト（tools/dump.py など）の照会語
+    if not text:
+        return ""
+    if text.isascii():
+        return _collapse_spaces(text)
+    s = unicodedata.normalize("NFKC", text).translate(_TERM_TABLE)
+    return _collapse_spaces(s)
+
+def normalize_batch(texts: Iterable[str], func: Callable[..., str] = normalize_match_key, *args) -> List[str]:
+    # 行の一覧をまとめて正規化する（同じ文字列は1回だけ処理）。戻り値は texts と同じ順
+    memo = {}
+    out = []
+    for t in texts:
+        v = memo.get(t)
+        if v is None:
+            v = memo[t] = func(t, *args)
+        out.append(v)
+    return out
+
+def memoized(func: Callable[..., str], maxsize: int) -> Callable[..., str]:
+    # 件数上限つきのメモ化（maxsize <= 0 ならそのまま）
+    return lru_cache(maxsize=maxsize)(func) if maxsize > 0 else func
+
 def hash_text(text: str) -> str:
     return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+def fts_escape_phrase(s: str) -> str:
+    # FTS列名扱いを避けるため強制フレーズ化（API の検索・照会と tools/dump.py で共通）
+    return '"' + (s or "").replace('"', '""') + '"'
+
+def mp_context():
+    # プロセスプールの起動方式。fork が使える環境（Linux）は fork、それ以外（Windows/macOS）は spawn
+    if "fork" in mp.get_all_start_methods() and sys.platform != "darwin":
+        return mp.get_context("fork")
+    return mp.get_context("spawn")
@@ -0,0 +1,123 @@
+# _FuzzyIndex.best_match が従来の ±2 文字バケット + difflib.get_close_matches と同じ結果を返すことのテスト。
+# 実行: リポジトリ直下で python -m pytest tests
+import difflib
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+m = None
+_orig_cwd = None
+
+
+def setUpModule():
+    # api.main は ui/ と data/ を作業ディレクトリからの相対パスで開くので、取り込む間だけリポジトリ直下へ移る
+    global m, _orig_cwd
+    _orig_cwd = os.getcwd()
+    os.chdir(ROOT)
+    import api.main
+    m = api.main
+
+
+def tearDownModule():
+    os.chdir(_orig_cwd)
+
+
+CUTOFFS = (0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+
+
+def _reference(word: str, keys, cutoff: float) -> str:
+    # 旧 _choose_uid_for_text_fuzzy と同じ候補集合：±2 文字の長さ、そこが空なら全キー
+    cand = [k for k in keys if abs(len(k) - len(word)) <= 2]
+    if not cand:
+        cand = list(keys)
+    near = difflib.get_close_matches(word, cand, n=1, cutoff=cutoff)
+    return near[0] if near else ""
+
+
+def _edit(rng: random.Random, s: str, alphabet: str) -> str:
+    # 置換・挿入・削除を数回ほどこして近いけれど一致しない問い合わせを作る
+    s = list(s)
+    for _ in range(rng.randint(0, 4)):
+        op = rng.randrange(3)
+        pos = rng.randrange(len(s) + 1)
+        if op == 0 and pos < len(s):
+            s[pos] = rng.choice(alphabet)
+        elif op == 1:
+            s.insert(pos, rng.choice(alphabet))
+        elif s and pos < len(s):
+            del s[pos]
+    return "".join(s)
+
+
+class FuzzyIndexTest(unittest.TestCase):
+    def assertSameAsDifflib(self, index, keys, word, cutoff):
+        self.assertEqual(index.best_match(word, cutoff), _reference(word, keys, cutoff),
+                         "word=%r cutoff=%r" % (word, cutoff))
+
+    def test_random_corpora_match_difflib(self):
+        rng = random.Random(20240601)
+        short_paths = 0
+        fallbacks = 0
+        for c in range(60):
+            # 文字種を絞って共有 n-gram の多いキーを作る（短いキーも混ぜる）
+            alphabet = "abcde fgh" if c % 2 else "abcdefghijklmnopqrstuvwxyz "
+            keys = sorted({"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 40)))
+                           for _ in range(rng.randint(20, 200))})
+            index = m._FuzzyIndex(keys)
+            for q in range(80):
+                if q % 10 == 9:
+                    # どのキーとも長さが離れた問い合わせ（±2 の窓が空になる）
+                    word = "".join(rng.choice(alphabet) for _ in range(rng.randint(43, 60)))
+                else:
+                    word = _edit(rng, rng.choice(keys), alphabet)
+                cutoff = rng.choice(CUTOFFS)
+                lengths = index._candidate_lengths(len(word), cutoff)
+                if not any(abs(lb - len(word)) <= 2 for lb in index.len_range):
+                    fallbacks += 1
+                if any(index._min_shared_grams(len(word), lb, cutoff) <= 0 for lb in lengths):
+                    short_paths += 1
+                self.assertSameAsDifflib(index, keys, word, cutoff)
+        # 乱数の組み合わせが両方の経路を実際に通っていること
+        self.assertGreater(short_paths, 0)
+        self.assertGreater(fallbacks, 0)
+
+    def test_short_keys_are_verified_without_ngram_filter(self):
+        keys = ["ab", "abc", "abd", "xyz", "abcd"]
+        index = m._FuzzyIndex(keys)
+        self.assertLessEqual(index._min_shared_grams(3, 3, 0.6), 0)
+        for word in ("abx", "ab", "a", "zyx", "abcx"):
+            for cutoff in CUTOFFS:
+                self.assertSameAsDifflib(index, keys, word, cutoff)
+        self.assertEqual(index.best_match("abx", 0.6), "ab")
+
+    def test_empty_length_window_falls_back_to_all_keys(self):
+        keys = ["fireball spell", "fire bolt spell", "ice storm spell"]
+        index = m._FuzzyIndex(keys)
+        word = "fireball"  # ±2 文字に該当する長さのキーが無い
+        self.assertFalse(any(abs(len(k) - len(word)) <= 2 for k in keys))
+        self.assertEqual(index.best_match(word, 0.6), "fireball spell")
+        for cutoff in CUTOFFS:
+            self.assertSameAsDifflib(index, keys, word, cutoff)
+
+    def test_ties_go_to_the_larger_string(self):
+        # 同点のときは get_close_matches と同じく (score, 文字列) で大きい方
+        keys = ["goblin camx", "goblin camy", "goblin camw"]
+        index = m._FuzzyIndex(keys)
+        word = "goblin camz"
+        scores = {difflib.SequenceMatcher(None, word, k).ratio() for k in keys}
+        self.assertEqual(len(scores), 1)
+        self.assertEqual(index.best_match(word, 0.6), "goblin camy")
+        self.assertSameAsDifflib(index, keys, word, 0.6)
+
+    def test_payload_roundtrip(self):
+        keys = ["magic missile", "magic missiles", "magic weapon"]
+        index = m._FuzzyIndex.from_payload(m._FuzzyIndex(keys).to_payload())
+        self.assertEqual(index.best_match("magic misile", 0.8), "magic missile")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+# /import/xml の取込と FTS（entries_fts / entries_fts_ja）の差分同期のテスト。
+# 実行: リポジトリ直下で python -m pytest tests
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+m = None
+client = None
+_orig_cwd = None
+_tmp = None
+
+SRC = "XML:Loca EN|Loca JP"
+
+
+def setUpModule():
+    # api.main は ui/ と data/ を作業ディレクトリからの相対パスで開くので、
+    # リポジトリ直下で取り込んでから空のスキーマだけの一時 DB があるディレクトリへ移る
+    global m, client, _orig_cwd, _tmp
+    _orig_cwd = os.getcwd()
+    os.chdir(ROOT)
+    import api.main
+    from fastapi.testclient import TestClient
+    m = api.main
+    _tmp = tempfile.mkdtemp(prefix="tdb_test_")
+    os.makedirs(os.path.join(_tmp, "data"))
+    con = sqlite3.connect(os.path.join(_tmp, m.DB_PATH))
+    with open(os.path.join(ROOT, "db", "schema.sql"), encoding="utf-8") as f:
+        con.executescript(f.read())
+    con.close()
+    os.chdir(_tmp)
+    m._POOL.close_all()
+    m.ensure_schema()
+    client = TestClient(m.app)  # with を使わないので startup（ブラウザ起動）は走らない
+
+
+def tearDownModule():
+    m._POOL.close_all()
+    os.chdir(_orig_cwd)
+    shutil.rmtree(_tmp, ignore_errors=True)
+
+
+def _xml(rows) -> bytes:
+    body = "".join(f'<content contentuid="{k}" version="1">{t}</content>\n' for k, t in rows)
+    return f"<?xml version='1.0' encoding='utf-8'?>\n<contentList>\n{body}</contentList>\n".encode()
+
+
+def _fts_match(table: str, query: str):
+    with m.acquire_con() as con:
+        return sorted(r[0] for r in con.execute(f"SELECT rowid FROM {table} WHERE {table} MATCH ?", (query,)))
+
+
+def _fts_shadow():
+    # FTS5 の索引本体。書き込みがあれば必ず変わる
+    with m.acquire_con() as con:
+        return [[tuple(r) for r in con.execute(f"SELECT id, block FROM {t}_data ORDER BY id")]
+                for t in ("entries_fts", "entries_fts_ja")]
+
+
+class ImportXmlTest(unittest.TestCase):
+    EN = [("h001", "Fire Bolt"), ("h002", "Magic Missile"), ("h003", "Goblin Camp")]
+    JA = [("h001", "ファイアボルト"), ("h002", "マジックミサイル"), ("h003", "ゴブリンの野営地")]
+
+    def setUp(self):
+        m.delete_source(SRC)
+
+    def _import(self, en, ja, **form):
+        data = {"replace_src": "false"}
+        data.update(form)
+        return client.post("/import/xml", data=data,
+                           files={"enfile": ("en.xml", _xml(en)), "jafile": ("ja.xml", _xml(ja))})
+
+    def _rows(self):
+        with m.acquire_con() as con:
+            return {r["entry_key"]: (r["id"], r["en_text"], r["ja_text"]) for r in con.execute(
+                "SELECT id, entry_key, en_text, ja_text FROM entry_pairs WHERE source_name=?", (SRC,))}
+
+    def assertFtsConsistent(self):
+        with m.acquire_con() as con:
+            for t in ("entries_fts", "entries_fts_ja"):
+                con.execute(f"INSERT INTO {t}({t}) VALUES ('integrity-check')")
+
+    def test_unchanged_reimport_leaves_fts_untouched(self):
+        r = self._import(self.EN, self.JA)
+        self.assertEqual(r.status_code, 200, r.text)
+        self.assertEqual(r.json()["inserted"], 3)
+        rows, shadow = self._rows(), _fts_shadow()
+
+        r = self._import(self.EN, self.JA)
+        self.assertEqual(r.status_code, 200, r.text)
+        self.assertEqual(self._rows(), rows)
+        self.assertEqual(_fts_shadow(), shadow)
+        self.assertFtsConsistent()
+
+    def test_changed_row_updates_both_fts_tables(self):
+        self.assertEqual(self._import(self.EN, self.JA).status_code, 200)
+        rid = self._rows()["xmlid:h002"][0]
+        self.assertEqual(_fts_match("entries_fts", "missile"), [rid])
+        self.assertEqual(_fts_match("entries_fts_ja", "マジック"), [rid])
+
+        en = [(k, "Magic Weapon" if k == "h002" else t) for k, t in self.EN]
+        ja = [(k, "魔法の武器" if k == "h002" else t) for k, t in self.JA]
+        r = self._import(en, ja)
+        self.assertEqual(r.status_code, 200, r.text)
+        rows = self._rows()
+        self.assertEqual(rows["xmlid:h002"], (rid, "Magic Weapon", "魔法の武器"))
+        self.assertEqual(_fts_match("entries_fts", "missile"), [])
+        self.assertEqual(_fts_match("entries_fts", "weapon"), [rid])
+        self.assertEqual(_fts_match("entries_fts_ja", "マジック"), [])
+        self.assertEqual(_fts_match("entries_fts_ja", "魔法の"), [rid])
+        # 変わっていない行はそのまま
+        self.assertEqual(_fts_match("entries_fts", "goblin"), [rows["xmlid:h003"][0]])
+        self.assertFtsConsistent()
+
+    def test_strict_key_mismatch_is_rejected(self):
+        r = self._import(self.EN, self.JA[:2] + [("h999", "余分")])
+        self.assertEqual(r.status_code, 400)
+        detail = r.json()["detail"]
+        self.assertTrue(detail["strict_mismatch"])
+        self.assertEqual(detail["only_in_en_sample"], ["h003"])
+        self.assertEqual(detail["only_in_ja_sample"], ["h999"])
+        self.assertEqual(self._rows(), {})
+
+        # strict=false なら共通キーだけ入る
+        r = self._import(self.EN, self.JA[:2], strict="false")
+        self.assertEqual(r.status_code, 200, r.text)
+        self.assertEqual(sorted(self._rows()), ["xmlid:h001", "xmlid:h002"])
+
+    def test_delete_source_removes_rows_from_fts(self):
+        self.assertEqual(self._import(self.EN, self.JA).status_code, 200)
+        self.assertEqual(len(_fts_match("entries_fts", "fire OR magic OR goblin")), 3)
+        self.assertEqual(m.delete_source(SRC)["deleted"], 3)
+        self.assertEqual(self._rows(), {})
+        self.assertEqual(_fts_match("entries_fts", "fire OR magic OR goblin"), [])
+        self.assertEqual(_fts_match("entries_fts_ja", "ゴブリン"), [])
+        self.assertFtsConsistent()
+
+
+if __name__ == "__main__":
+    unittest.main()
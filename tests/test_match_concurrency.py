@@ -0,0 +1,95 @@
+# 直列照合と並列照合（fork したワーカー）が同時に走っても止まらないことの回帰テスト。
+# 実行: リポジトリ直下で python -m pytest tests
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from importers.common import mp_context  # noqa: E402
+
+m = None
+_orig_cwd = None
+
+
+def setUpModule():
+    # api.main は ui/ と data/ を作業ディレクトリからの相対パスで開くので、取り込む間だけリポジトリ直下へ移る
+    global m, _orig_cwd
+    _orig_cwd = os.getcwd()
+    os.chdir(ROOT)
+    import api.main
+    m = api.main
+
+
+def tearDownModule():
+    os.chdir(_orig_cwd)
+
+
+WORDS = "fire ice goblin camp attack saving throw magic missile spell slot level creature target damage".split()
+
+
+def _official_index() -> "m._OfficialIndex":
+    en_rows = [(f"h{i:05d}", "1", " ".join(WORDS[(i + k) % len(WORDS)] for k in range(4)) + f" {i}")
+               for i in range(500)]
+    ja_rows = [(uid, ver, f"訳{uid}") for uid, ver, _ in en_rows]
+    en_map, ja_map, uid2en = m._build_official_indexes(en_rows, ja_rows)
+    return m._OfficialIndex(en_map, ja_map, uid2en, len(en_rows), len(ja_rows))
+
+
+def _mod_texts(n: int):
+    # 完全一致しない（fuzzy まで進む）行を並列化の下限以上に用意する
+    return [" ".join(WORDS[(i + k) % len(WORDS)] for k in range(4)) + f" {i % 500}!" for i in range(n)]
+
+
+@unittest.skipUnless(mp_context().get_start_method() == "fork", "fork でのみ起きる問題")
+class MatchConcurrencyTest(unittest.TestCase):
+    TIMEOUT = 60
+
+    def setUp(self):
+        # workers は CPU コア数で頭打ちになるので、1コアの環境でも並列経路を通す
+        patcher = mock.patch.object(m.os, "cpu_count", return_value=4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run(self, fn):
+        box = {}
+        t = threading.Thread(target=lambda: box.setdefault("out", fn()), daemon=True)
+        t.start()
+        t.join(self.TIMEOUT)
+        self.assertFalse(t.is_alive(), "match did not finish (worker deadlock)")
+        return box["out"]
+
+    def test_parallel_match_while_fuzzy_lock_is_held(self):
+        # 直列照合のスレッドが fuzzy() の途中でロックを握っている瞬間に fork した状態を再現する
+        index = _official_index()
+        texts = _mod_texts(m.MATCH_PARALLEL_MIN_ROWS)
+        serial = m._match_rows(texts, index, True, 0.6, workers=1)
+        with index._fuzzy_lock:
+            parallel = self._run(lambda: m._match_rows(texts, index, True, 0.6, workers=2))
+        self.assertEqual(parallel, serial)
+
+    def test_serial_and_parallel_matches_concurrently(self):
+        index = _official_index()
+        texts = _mod_texts(m.MATCH_PARALLEL_MIN_ROWS)
+        expected = m._match_rows(texts, index, True, 0.6, workers=1)
+        stop = threading.Event()
+
+        def serial_loop():
+            while not stop.is_set():
+                m._match_rows(texts[:50], index, True, 0.6, workers=1)
+
+        bg = threading.Thread(target=serial_loop, daemon=True)
+        bg.start()
+        try:
+            for _ in range(2):
+                self.assertEqual(self._run(lambda: m._match_rows(texts, index, True, 0.6, workers=2)), expected)
+        finally:
+            stop.set()
+            bg.join(self.TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
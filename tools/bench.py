@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CLI: 合成コーパスでのベンチマーク（取込・検索・照会・BG3 照合・tools/dump.py）
+例:
+  python tools/bench.py --scale 20000
+  python tools/bench.py --scale 500000 --only import,search,query --out bench.json
+  python tools/bench.py --scale 2000000 --mod_lines 50000 --workdir bench_work --keep
+
+公式 EN/JA の .loca.xml と MOD XML を --seed から決定的に生成し、作業ディレクトリに置いた空の DB で
+API サーバ（uvicorn）を別プロセスで起動して HTTP で計測する。結果は JSON（標準出力または --out）。
+各項目: 件数・所要時間・スループット・レイテンシ（p50/p95/p99, ms）・その項目中のピーク RSS（KB、取れる環境のみ）。
+"""
+import argparse, json, os, platform, random, shutil, socket, sqlite3, subprocess, sys, tempfile, time
+import http.client, urllib.parse
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+REPO = Path(__file__).resolve().parents[1]
+BENCHES = ("import", "search", "query", "match", "dump")
+
+# ---------------- 合成コーパス ----------------
+_SYLLABLES = ["ka", "ro", "th", "el", "mar", "din", "gor", "ash", "ven", "tor", "is", "ul", "bre", "wyn",
+              "dra", "sil", "mor", "an", "ce", "qu", "lo", "ith", "rha", "zan", "fel", "or", "ny", "gal"]
+_COMMON = ["the", "of", "and", "to", "a", "in", "is", "you", "that", "it", "for", "with", "on", "your",
+           "damage", "target", "turn", "creature", "spell", "attack", "saving", "throw", "action", "bonus"]
+_KANA = [chr(c) for c in range(0x3041, 0x3094)] + [chr(c) for c in range(0x30A1, 0x30F7)]
+_KANJI = list("攻撃呪文魔法防御体力筋力敏捷耐久知力判断魅力行動追加効果対象範囲時間回復毒炎氷雷光闇死者生命神殿王国剣盾弓矢鎧")
+
+class Corpus:
+    """--seed から決定的に文字列を作る。EN は語彙からの短い名前・文章（タグ・改行つきを含む）、JA はかな・漢字"""
+
+    def __init__(self, seed: int, vocab: int):
+        self.rnd = random.Random(seed)
+        words = set()
+        while len(words) < vocab:
+            words.add("".join(self.rnd.choice(_SYLLABLES) for _ in range(self.rnd.randint(1, 4))))
+        self.words = sorted(words)
+
+    def uid(self, i: int) -> str:
+        # BG3 風の contentuid（h + 16進 + g 区切り）。i から作るので重複しない
+        h = f"{i:032x}"
+        return f"h{h[:8]}g{h[8:12]}g{h[12:16]}g{h[16:20]}g{h[20:]}"
+
+    def _word(self) -> str:
+        r = self.rnd
+        return r.choice(_COMMON) if r.random() < 0.35 else r.choice(self.words)
+
+    def en(self) -> str:
+        r = self.rnd
+        roll = r.random()
+        if roll < 0.4:  # アイテム名・呪文名など
+            return " ".join(self._word().capitalize() for _ in range(r.randint(1, 3)))
+        words = [self._word() for _ in range(r.randint(6, 25))]
+        words[0] = words[0].capitalize()
+        if roll > 0.8:  # ツールチップ付きの語・改行
+            k = r.randrange(len(words))
+            name = words[k].capitalize()
+            words[k] = f'<LSTag Tooltip="{name}">{name}</LSTag>'
+            if r.random() < 0.5:
+                words.insert(r.randrange(1, len(words)), "<br>")
+        return " ".join(words) + r.choice([".", ".", "!", "?"])
+
+    def ja(self, en: str) -> str:
+        r = self.rnd
+        n = max(2, len(en) // 3)
+        s = "".join(r.choice(_KANJI) if r.random() < 0.3 else r.choice(_KANA) for _ in range(n))
+        return s + ("。" if len(en) > 30 else "")
+
+    def mutate(self, en: str) -> str:
+        # 照合の fuzzy 用：1語差し替え・句読点の変更
+        r = self.rnd
+        words = en.split(" ")
+        if len(words) > 3:
+            words[r.randrange(len(words))] = self._word()
+            return " ".join(words)
+        return en.rstrip(".!?") + r.choice(["!", "...", " "])
+
+def _loca_open(path: Path):
+    f = open(path, "w", encoding="utf-8", newline="\n")
+    f.write("<?xml version=\"1.0\" encoding=\"utf-8\"?>\n<contentList>\n")
+    return f
+
+def _loca_row(f, uid: str, text: str):
+    f.write(f"<content contentuid={quoteattr(uid)} version=\"1\">{escape(text)}</content>\n")
+
+def _loca_close(f):
+    f.write("</contentList>\n")
+    f.close()
+
+def generate(work: Path, scale: int, mod_lines: int, seed: int, samples: int) -> dict:
+    """公式 EN/JA と MOD XML を書き出し、検索・照会・dump 用の語のサンプルを返す（全件はメモリに持たない）"""
+    corpus = Corpus(seed, vocab=max(2000, min(200000, scale // 10)))
+    r = corpus.rnd
+    en_dir, ja_dir = work / "official" / "en", work / "official" / "ja"
+    en_dir.mkdir(parents=True, exist_ok=True)
+    ja_dir.mkdir(parents=True, exist_ok=True)
+    en_path, ja_path, mod_path = en_dir / "english.loca.xml", ja_dir / "japanese.loca.xml", work / "mod.loca.xml"
+
+    pick = set(r.sample(range(scale), min(scale, mod_lines)))
+    mod_src, terms, prev = [], [], []
+    fe, fj = _loca_open(en_path), _loca_open(ja_path)
+    for i in range(scale):
+        # BG3 と同じく同じ英文が別 uid で繰り返し出る
+        en = r.choice(prev) if prev and r.random() < 0.05 else corpus.en()
+        if len(prev) < 1000:
+            prev.append(en)
+        elif r.random() < 0.01:
+            prev[r.randrange(1000)] = en
+        ja = corpus.ja(en)
+        _loca_row(fe, corpus.uid(i), en)
+        _loca_row(fj, corpus.uid(i), ja)
+        if i in pick:
+            mod_src.append(en)
+        # 照会語のサンプル（reservoir）：短い行はそのまま、文章は2語を切り出す
+        words = [w for w in en.replace("<br>", " ").split(" ") if w.isalpha()]
+        term = en if len(en) < 40 and "<" not in en else " ".join(words[:2])
+        if term:
+            if len(terms) < samples:
+                terms.append((term, ja[:3]))
+            else:
+                k = r.randrange(i + 1)
+                if k < samples:
+                    terms[k] = (term, ja[:3])
+    _loca_close(fe)
+    _loca_close(fj)
+
+    # MOD: 6割は公式と同じ英文（exact）、2.5割は少し変えた英文（fuzzy 候補）、残りは新しい英文
+    fm = _loca_open(mod_path)
+    for i, en in enumerate(mod_src):
+        roll = r.random()
+        text = en if roll < 0.6 else corpus.mutate(en) if roll < 0.85 else corpus.en()
+        _loca_row(fm, f"mod{i:08d}", text)
+    _loca_close(fm)
+    r.shuffle(terms)
+    return {"en": en_path, "ja": ja_path, "en_dir": en_dir, "ja_dir": ja_dir, "mod": mod_path, "mod_lines": len(mod_src),
+            "terms": [t for t, _ in terms], "ja_terms": [j for _, j in terms if len(j) >= 2]}
+
+# ---------------- 計測 ----------------
+def percentile(sorted_vals, p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+def summarize(latencies, units: int = 0) -> dict:
+    # latencies: 秒。units: スループットの分子（省略時はリクエスト数）
+    s = sorted(latencies)
+    total = sum(s)
+    n = units or len(s)
+    return {"requests": len(s), "total_sec": round(total, 4),
+            "throughput_per_sec": round(n / total, 2) if total else None,
+            "p50_ms": round(percentile(s, 50) * 1000, 2), "p95_ms": round(percentile(s, 95) * 1000, 2),
+            "p99_ms": round(percentile(s, 99) * 1000, 2), "max_ms": round(s[-1] * 1000, 2) if s else 0.0}
+
+def reset_peak_rss(pid: int) -> bool:
+    # Linux のみ。clear_refs に 5 を書くと VmHWM が現在の RSS に戻る（項目ごとのピークを取るため）
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def proc_rss_kb(pid: int) -> dict:
+    # Linux のみ（/proc）。VmHWM は最後の reset_peak_rss（無ければプロセス開始）からのピーク
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith(("VmHWM:", "VmRSS:")):
+                    k, v = line.split(":", 1)
+                    out["peak_rss_kb" if k == "VmHWM" else "rss_kb"] = int(v.split()[0])
+    except OSError:
+        pass
+    return out
+
+class Server:
+    """作業ディレクトリで API を起動する（data/ と ui/ は相対パスで参照されるため）"""
+
+    def __init__(self, work: Path, port: int, pool_size: int):
+        self.work, self.port = work, port
+        self.peak_is_stage, self.peak_max = False, 0
+        env = dict(os.environ, TDB_AUTO_OPEN="0", TDB_POOL_SIZE=str(pool_size),
+                   PYTHONPATH=os.pathsep.join([str(REPO), os.environ.get("PYTHONPATH", "")]))
+        self.log = open(work / "server.log", "w", encoding="utf-8")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            cwd=work, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while True:
+            try:
+                if self.request("GET", "/health")[0] == 200:
+                    break
+            except OSError:
+                pass
+            if self.proc.poll() is not None or time.time() > deadline:
+                raise SystemExit(f"server failed to start (see {work / 'server.log'})")
+            time.sleep(0.2)
+
+    def request(self, method: str, path: str, body=None, headers=None, timeout: float = 3600):
+        con = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+        try:
+            con.request(method, path, body=body, headers=headers or {})
+            res = con.getresponse()
+            return res.status, res.read()
+        finally:
+            con.close()
+
+    def get_json(self, path: str, params: dict):
+        status, data = self.request("GET", path + "?" + urllib.parse.urlencode(params, doseq=True))
+        return self._check(status, data, path)
+
+    def post_json(self, path: str, payload: dict):
+        status, data = self.request("POST", path, json.dumps(payload).encode("utf-8"),
+                                    {"Content-Type": "application/json"})
+        return self._check(status, data, path)
+
+    def post_form(self, path: str, fields: dict, files: dict):
+        body, length, ctype = multipart(fields, files)
+        status, data = self.request("POST", path, body, {"Content-Type": ctype, "Content-Length": str(length)})
+        return self._check(status, data, path)
+
+    @staticmethod
+    def _check(status: int, data: bytes, path: str):
+        if status != 200:
+            raise SystemExit(f"{path} -> HTTP {status}: {data[:300]!r}")
+        return json.loads(data)
+
+    def reset_peak(self):
+        # 各項目の前に呼ぶ。リセットできない環境ではプロセス全体のピークとして別名で出す
+        self.peak_is_stage = reset_peak_rss(self.proc.pid)
+
+    def rss(self) -> dict:
+        # 項目ごとのピーク（peak_rss_kb）。リセットできなければ process_peak_rss_kb
+        out = proc_rss_kb(self.proc.pid)
+        if "peak_rss_kb" in out:
+            self.peak_max = max(self.peak_max, out["peak_rss_kb"])
+            if not self.peak_is_stage:
+                out["process_peak_rss_kb"] = out.pop("peak_rss_kb")
+        return out
+
+    def process_rss(self) -> dict:
+        # 全項目を通したピーク（各項目のピークの最大）と現在の RSS
+        out = proc_rss_kb(self.proc.pid)
+        if "peak_rss_kb" in out:
+            out["process_peak_rss_kb"] = max(self.peak_max, out.pop("peak_rss_kb"))
+        return out
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.log.close()
+
+def multipart(fields: dict, files: dict):
+    # ファイルは読みながら送る（2M 行の XML でもメモリに載せない）。戻り値: (本体の iterable, 長さ, Content-Type)
+    boundary = "----tdbbench" + os.urandom(8).hex()
+    parts, length = [], 0
+    for k, v in fields.items():
+        b = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{k}\"\r\n\r\n{v}\r\n").encode("utf-8")
+        parts.append(b)
+        length += len(b)
+    for k, p in files.items():
+        head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{k}\"; filename=\"{p.name}\"\r\n"
+                "Content-Type: application/xml\r\n\r\n").encode("utf-8")
+        parts.extend([head, p, b"\r\n"])
+        length += len(head) + p.stat().st_size + 2
+    tail = f"--{boundary}--\r\n".encode("ascii")
+    parts.append(tail)
+    length += len(tail)
+
+    def body():
+        for part in parts:
+            if isinstance(part, Path):
+                with open(part, "rb") as f:
+                    while True:
+                        chunk = f.read(1 << 20)
+                        if not chunk:
+                            break
+                        yield chunk
+            else:
+                yield part
+    return body(), length, f"multipart/form-data; boundary={boundary}"
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return time.perf_counter() - t0, out
+
+def log(msg: str):
+    print(f"[BENCH] {msg}", file=sys.stderr, flush=True)
+
+# ---------------- 各ベンチマーク ----------------
+def bench_import(srv: Server, gen: dict, scale: int) -> dict:
+    srv.reset_peak()
+    fields = {"src_en": "Bench EN", "src_ja": "Bench JP", "priority": "100", "strict": "true", "replace_src": "true"}
+    sec, res = timed(srv.post_form, "/import/xml", fields, {"enfile": gen["en"], "jafile": gen["ja"]})
+    return {"rows": res.get("inserted"), "sec": round(sec, 3), "rows_per_sec": round(scale / sec, 1),
+            "server_rows_per_sec": res.get("rows_per_sec"), **srv.rss()}
+
+def bench_search(srv: Server, gen: dict, n: int, seed: int) -> dict:
+    srv.reset_peak()
+    r = random.Random(seed)
+    out = {}
+    for name, pool in (("en", gen["terms"]), ("ja", gen["ja_terms"])):
+        qs = list(dict.fromkeys(pool))[:n]
+        r.shuffle(qs)
+        srv.request("POST", "/admin/cache/clear")
+        lat, hits = [], 0
+        for q in qs:
+            sec, res = timed(srv.get_json, "/search", {"q": q, "size": 50})
+            lat.append(sec)
+            hits += len(res["items"])
+        out[name] = {**summarize(lat), "avg_hits": round(hits / max(1, len(qs)), 1)}
+    out.update(srv.rss())
+    return out
+
+def bench_query(srv: Server, gen: dict, line_counts, top_ks, repeat: int, seed: int) -> dict:
+    srv.reset_peak()
+    r = random.Random(seed)
+    out = {}
+    for lines in line_counts:
+        for k in top_ks:
+            lat, terms = [], 0
+            for _ in range(repeat):
+                batch = [r.choice(gen["terms"]) for _ in range(lines)]
+                srv.request("POST", "/admin/cache/clear")  # 語単位のキャッシュを効かせない
+                sec, _ = timed(srv.post_json, "/query", {"lines": batch, "top_k": k})
+                lat.append(sec)
+                terms += lines
+            out[f"lines={lines},top_k={k}"] = {**summarize(lat, terms), "lines": lines, "top_k": k}
+    out.update(srv.rss())
+    return out
+
+def bench_match(srv: Server, gen: dict, repeat: int, cutoff: float, workers: int) -> dict:
+    srv.reset_peak()
+    out = {}
+    mod_lines = gen["mod_lines"]
+    for mode, fuzzy in (("exact", False), ("fuzzy", True)):
+        fields = {"en_dir": str(gen["en_dir"]), "ja_dir": str(gen["ja_dir"]), "enable_fuzzy": str(fuzzy).lower(),
+                  "cutoff": str(cutoff), "workers": str(workers), "rematch": "true"}
+        lat, counts = [], {}
+        for i in range(repeat):
+            # 1回目は公式インデックスの構築（またはキャッシュ読み込み）を含む
+            sec, res = timed(srv.post_form, "/match/bg3", fields, {"modfile": gen["mod"]})
+            lat.append(sec)
+            counts = res.get("counts", {})
+            srv.request("DELETE", f"/match/results/{res['result_id']}")
+        out[mode] = {**summarize(lat[1:] or lat, mod_lines * len(lat[1:] or lat)), "first_sec": round(lat[0], 3),
+                     "mod_lines": mod_lines, "counts": counts}
+    out.update(srv.rss())
+    return out
+
+def bench_dump(work: Path, gen: dict, n: int, workers: int) -> dict:
+    terms = (gen["terms"] * (n // max(1, len(gen["terms"])) + 1))[:n]
+    tf, of = work / "terms.txt", work / "dump.jsonl"
+    tf.write_text("\n".join(terms) + "\n", encoding="utf-8")
+    cmd = [sys.executable, str(REPO / "tools" / "dump.py"), "--db", str(work / "data" / "app.sqlite"),
+           "--file", str(tf), "--exact", "--top_k", "3", "--workers", str(workers), "--out", str(of)]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rss = {}
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss は Linux では KB、macOS ではバイト
+        rss["peak_rss_kb"] = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    else:
+        proc.wait()
+    sec = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(f"tools/dump.py failed: exit {proc.returncode}")
+    return {"terms": n, "workers": workers, "sec": round(sec, 3), "terms_per_sec": round(n / sec, 1), **rss}
+
+# ---------------- main ----------------
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=20000, help="公式 EN/JA の行数（1万〜200万程度）")
+    ap.add_argument("--mod_lines", type=int, default=0, help="MOD XML の行数（省略時は scale/10、上限 20000）")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--only", default=",".join(BENCHES), help="実行する項目（カンマ区切り。取込は常に実行）")
+    ap.add_argument("--search_requests", type=int, default=200, help="/search の語数（EN・JA それぞれ）")
+    ap.add_argument("--query_lines", default="1,100,1000", help="/query の1リクエストあたり行数（カンマ区切り）")
+    ap.add_argument("--query_top_k", default="1,3,10", help="/query の top_k（カンマ区切り）")
+    ap.add_argument("--query_repeat", type=int, default=5)
+    ap.add_argument("--match_repeat", type=int, default=3, help="/match/bg3 の回数（1回目は別に first_sec として出す）")
+    ap.add_argument("--cutoff", type=float, default=0.92)
+    ap.add_argument("--match_workers", type=int, default=1)
+    ap.add_argument("--dump_terms", type=int, default=10000)
+    ap.add_argument("--dump_workers", type=int, default=1)
+    ap.add_argument("--pool_size", type=int, default=4, help="サーバの TDB_POOL_SIZE")
+    ap.add_argument("--workdir", help="作業ディレクトリ（省略時は一時ディレクトリ）")
+    ap.add_argument("--keep", action="store_true", help="作業ディレクトリを消さない")
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--out", help="結果 JSON の出力先（省略時は標準出力）")
+    args = ap.parse_args()
+
+    only = {b.strip() for b in args.only.split(",") if b.strip()}
+    unknown = only - set(BENCHES)
+    if unknown:
+        ap.error(f"unknown bench: {', '.join(sorted(unknown))}")
+    mod_lines = args.mod_lines or min(20000, max(100, args.scale // 10))
+
+    work = Path(args.workdir).resolve() if args.workdir else Path(tempfile.mkdtemp(prefix="tdb_bench_"))
+    (work / "data").mkdir(parents=True, exist_ok=True)
+    db = work / "data" / "app.sqlite"
+    if db.exists():
+        db.unlink()
+    con = sqlite3.connect(db)
+    con.executescript((REPO / "db" / "schema.sql").read_text(encoding="utf-8"))
+    con.close()
+    if not (work / "ui").exists():
+        shutil.copytree(REPO / "ui", work / "ui")
+
+    report = {"meta": {"scale": args.scale, "mod_lines": mod_lines, "seed": args.seed,
+                       "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                       "platform": platform.platform(), "cpus": os.cpu_count()},
+              "results": {}}
+    try:
+        log(f"generating corpus scale={args.scale} mod_lines={mod_lines} in {work}")
+        sec, gen = timed(generate, work, args.scale, mod_lines, args.seed, max(args.search_requests, 5000))
+        report["meta"]["generate_sec"] = round(sec, 3)
+        report["meta"]["xml_bytes"] = gen["en"].stat().st_size + gen["ja"].stat().st_size
+
+        srv = Server(work, args.port or _free_port(), args.pool_size)
+        try:
+            log("import")
+            report["results"]["import"] = bench_import(srv, gen, args.scale)
+            if "search" in only:
+                log("search")
+                report["results"]["search"] = bench_search(srv, gen, args.search_requests, args.seed)
+            if "query" in only:
+                log("query")
+                report["results"]["query"] = bench_query(srv, gen, _ints(args.query_lines), _ints(args.query_top_k),
+                                                         args.query_repeat, args.seed)
+            if "match" in only:
+                log("match")
+                report["results"]["match"] = bench_match(srv, gen, max(1, args.match_repeat), args.cutoff,
+                                                         args.match_workers)
+            report["results"]["server"] = srv.process_rss()
+        finally:
+            srv.stop()
+        if "dump" in only:
+            log("dump")
+            report["results"]["dump"] = bench_dump(work, gen, args.dump_terms, args.dump_workers)
+    finally:
+        if not args.keep and not args.workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+        log(f"wrote {args.out}")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
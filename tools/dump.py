@@ -5,19 +5,212 @@ CLI: 辞書照会のバッチ出力
 例:
   python tools/dump.py --db data/app.sqlite --q "saving throw" --top_k 3
   python tools/dump.py --db data/app.sqlite --file terms.txt --top_k 5 --max_len 240 --wb
+  python tools/dump.py --db data/app.sqlite --file terms.txt --exact --workers 4 --out result.jsonl
+
+語リストは --chunk 語ずつ一時テーブルに入れ、完全一致・FTS をそれぞれ1文の SQL でまとめて引く。
+--workers 2 以上で読み取り専用接続を持つプロセスに分けて並列に処理する（出力順は入力順のまま）。
 """
-import argparse, sqlite3, sys, json, re, unicodedata
-
-def jnorm(text: str) -> str:
-    if not text:
-        return ""
-    s = unicodedata.normalize("NFKC", text)
-    z2h = {"，":"、","．":"。","･":"・","ｰ":"ー","－":"ー","—":"ー","―":"ー","〜":"～","～":"～"}
-    for k,v in z2h.items():
-        s = s.replace(k, v)
-    s = re.sub(r"\s+", " ", s).strip()
+import argparse, sqlite3, sys, json, re, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))  # importers/ を使うため（tools/ から直接実行される）
+from importers.common import fts_escape_phrase, mp_context, normalize_batch, normalize_term
+
+# FTS5 の bareword だけでできた語（演算子を含まない）はそのまま MATCH に渡せるので一括照会に回す
+_FTS_BAREWORD_RE = re.compile(r"[0-9A-Za-z_\u0080-\U0010FFFF]+(?: [0-9A-Za-z_\u0080-\U0010FFFF]+)*")
+_FTS_OPERATORS = {"AND", "OR", "NOT"}
+
+def ensure_exact_index(con):
+    # API（ensure_schema）と同じ式索引。API 未起動の DB でも --exact が全件走査にならないように
+    con.execute("CREATE INDEX IF NOT EXISTS ix_entry_en_lower ON entry_pairs(LOWER(en_text), COALESCE(source_name,''), priority)")
+    con.commit()
+
+def open_readonly(db: str) -> sqlite3.Connection:
+    # 照会は読むだけなので読み取り専用で開く（一時テーブルは temp 側に作られるので使える）
+    con = sqlite3.connect(Path(db).resolve().as_uri() + "?mode=ro", uri=True, check_same_thread=False)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA cache_size=-65536")
+    con.execute("PRAGMA mmap_size=268435456")
+    con.execute("PRAGMA temp_store=MEMORY")
+    return con
+
+def fts_batchable(term: str) -> bool:
+    return bool(_FTS_BAREWORD_RE.fullmatch(term)) and not any(w in _FTS_OPERATORS for w in term.split(" "))
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+class WordBoundary:
+    # re.search(rf"\b{re.escape(term)}\b", text, re.IGNORECASE) と同じ判定。
+    # 語・本文とも ASCII なら find と前後1文字の比較だけで済ませ、正規表現はそれ以外の時だけ作る
+    __slots__ = ("term", "low", "head", "tail", "reobj")
+
+    def __init__(self, term: str):
+        self.term = term
+        self.low = term.lower() if term.isascii() else None
+        self.head, self.tail = _is_word(term[0]), _is_word(term[-1])
+        self.reobj = None
+
+    def search(self, text: str) -> bool:
+        if self.low is None or not text.isascii():
+            if self.reobj is None:
+                self.reobj = re.compile(rf"\b{re.escape(self.term)}\b", re.IGNORECASE)
+            return bool(self.reobj.search(text))
+        low, n = text.lower(), len(self.low)
+        i = low.find(self.low)
+        while i >= 0:
+            j = i + n
+            if (i > 0 and _is_word(low[i - 1])) != self.head and (j < len(low) and _is_word(low[j])) != self.tail:
+                return True
+            i = low.find(self.low, i + 1)
+        return False
+
+def build_filters(args, alias: str):
+    where, params = [], []
+    if args.source:
+        where.append(f"COALESCE({alias}.source_name,'') IN ({','.join('?' for _ in args.source)})")
+        params.extend(args.source)
+    if args.min_priority is not None:
+        where.append(f"{alias}.priority >= ?")
+        params.append(args.min_priority)
+    return where, params
+
+def query_exact(cur, terms, args):
+    # 語ごとに id 順の先頭 top_k 行（1語ずつ LIMIT top_k で引いていた時と同じ）
+    # 語→ix_entry_en_lower の順に引く。LOWER(q.term) と式同士で比べる（TEXT 列と比べると
+    # 比較の型親和性が合わず式索引が使われない）。source 条件があると ix_entry_source を選ばれるので索引も固定
+    cur.execute("DELETE FROM temp._dump_terms")
+    cur.executemany("INSERT OR IGNORE INTO temp._dump_terms (term) VALUES (?)", ((t,) for t in terms))
+    where, params = build_filters(args, "e")
+    where.insert(0, "LOWER(e.en_text) = LOWER(q.term)")
+    cur.execute(
+        f"""
+        SELECT term, en, ja, source, priority FROM (
+            SELECT q.rowid AS qid, q.term AS term, e.id AS id, e.en_text AS en, e.ja_text AS ja,
+                   e.source_name AS source, e.priority AS priority,
+                   ROW_NUMBER() OVER (PARTITION BY q.rowid ORDER BY e.id) AS rn
+            FROM temp._dump_terms q
+            CROSS JOIN entry_pairs e INDEXED BY ix_entry_en_lower ON {' AND '.join(where)}
+        )
+        WHERE rn <= ?
+        ORDER BY qid, id
+        """,
+        (*params, args.top_k),
+    )
+    out = {}
+    for r in cur:
+        out.setdefault(r["term"], []).append(r)
+    return out
+
+def query_fts(cur, limits, args):
+    # limits: 語 -> 取得上限。bareword の語は1文にまとめ、それ以外は従来どおり1語ずつ
+    # （FTS5 は rowid 昇順なので、最大の上限で引いて語ごとに先頭から切り詰めれば結果は同じ）
+    # CROSS JOIN で FTS を外側に固定する（source 条件があると ix_entry_source 側から全件なめる計画になるため）
+    where, params = build_filters(args, "e2")
+    out = {}
+    batch = [t for t in limits if fts_batchable(t)]
+    if batch:
+        cur.execute("DELETE FROM temp._dump_fts")
+        cur.executemany("INSERT OR IGNORE INTO temp._dump_fts (term) VALUES (?)", ((t,) for t in batch))
+        cur.execute(
+            f"""
+            SELECT q.term AS term, e.en_text AS en, e.ja_text AS ja, e.source_name AS source, e.priority AS priority
+            FROM temp._dump_fts q
+            JOIN entry_pairs e ON e.id IN (
+                SELECT entries_fts.rowid
+                FROM entries_fts
+                CROSS JOIN entry_pairs e2 ON entries_fts.rowid = e2.id
+                WHERE {' AND '.join(['entries_fts MATCH q.term', *where])}
+                LIMIT ?
+            )
+            ORDER BY q.rowid, e.id
+            """,
+            (*params, max(limits[t] for t in batch)),
+        )
+        for r in cur:
+            lst = out.setdefault(r["term"], [])
+            if len(lst) < limits[r["term"]]:
+                lst.append(r)
+    sql = f"""
+        SELECT e2.en_text AS en, e2.ja_text AS ja, e2.source_name AS source, e2.priority AS priority
+        FROM entries_fts
+        CROSS JOIN entry_pairs e2 ON entries_fts.rowid = e2.id
+        WHERE {' AND '.join(['entries_fts MATCH ?', *where])}
+        LIMIT ?
+    """
+    for t in limits:
+        if t in out or fts_batchable(t):
+            continue
+        try:
+            out[t] = cur.execute(sql, (t, *params, limits[t])).fetchall()
+        except sqlite3.OperationalError:
+            # FTS の構文として読めない語（"Half-Elf" など）はフレーズとして引く
+            out[t] = cur.execute(sql, (fts_escape_phrase(t), *params, limits[t])).fetchall()
+    return out
+
+def snippet(t, term_lc, n, max_len):
+    if not t: return ""
+    ix = t.lower().find(term_lc)
+    if ix < 0: return (t[:max_len] + "…") if len(t) > max_len else t
+    pad = max_len//2; st = max(ix-pad,0); ed = min(ix+n+pad, len(t))
+    s = t[st:ed]
+    if st>0: s = "…" + s
+    if ed<len(t): s = s + "…"
     return s
 
+def resolve_chunk(con, terms, args) -> str:
+    # terms（正規化済み・入力順、重複あり）を引いて JSONL 文字列にする
+    uniq = list(dict.fromkeys(terms))
+    results = {t: ([], set()) for t in uniq}
+
+    def add_rows(term, rows):
+        matches, seen = results[term]
+        re_pat = WordBoundary(term) if args.wb else None
+        for r in rows:
+            en, ja = r["en"] or "", r["ja"] or ""
+            if re_pat and not re_pat.search(en):
+                continue
+            key = (en.lower(), ja.lower())
+            if key in seen: continue
+            seen.add(key); matches.append([en, ja, r["source"], r["priority"]])
+            if len(matches) >= args.top_k: break
+
+    cur = con.cursor()
+    if args.exact:
+        exact = query_exact(cur, uniq, args)
+        for t in uniq:
+            add_rows(t, exact.get(t, []))
+    limits = {t: (args.top_k - len(results[t][0])) * 6 for t in uniq if len(results[t][0]) < args.top_k}
+    if limits:
+        fts = query_fts(cur, limits, args)
+        for t in limits:
+            add_rows(t, fts.get(t, []))
+
+    lines = {}
+    for t in uniq:
+        matches = results[t][0]
+        if args.max_len and matches:
+            tl, n = t.lower(), len(t)
+            matches = [[snippet(en, tl, n, args.max_len), snippet(ja, tl, n, args.max_len), src, pr] for en,ja,src,pr in matches]
+        lines[t] = json.dumps({"term": t, "candidates": matches}, ensure_ascii=False) + "\n"
+    return "".join(lines[t] for t in terms)
+
+def prepare(con):
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS _dump_terms (term TEXT PRIMARY KEY)")
+    con.execute("CREATE TEMP TABLE IF NOT EXISTS _dump_fts (term TEXT PRIMARY KEY)")
+
+# ---- 並列ワーカー（プロセスごとに読み取り専用接続を1本持つ）----
+_worker = {}
+
+def _worker_init(args):
+    con = open_readonly(args.db)
+    prepare(con)
+    _worker["con"], _worker["args"] = con, args
+
+def _worker_chunk(terms):
+    return resolve_chunk(_worker["con"], terms, _worker["args"])
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--db", default="data/app.sqlite")
@@ -29,95 +222,44 @@ def main():
     ap.add_argument("--wb", action="store_true", help="単語境界（Pythonの\\bで厳密化）")
     ap.add_argument("--source", action="append", help="source_name フィルタ（複数可）")
     ap.add_argument("--min_priority", type=int, default=None)
+    ap.add_argument("--out", help="JSONL の出力先ファイル（省略時は標準出力）")
+    ap.add_argument("--chunk", type=int, default=2000, help="1回の SQL でまとめて引く語数")
+    ap.add_argument("--workers", type=int, default=1, help="並列プロセス数（2以上で読み取り専用接続を並列に使う）")
     args = ap.parse_args()
 
-    terms = []
+    raw = []
     if args.q:
-        terms.append(args.q)
+        raw.append(args.q)
     if args.file:
         with open(args.file, "r", encoding="utf-8") as f:
-            terms.extend([line.strip() for line in f if line.strip()])
-
-    con = sqlite3.connect(args.db, check_same_thread=False)
-    con.row_factory = sqlite3.Row
+            raw.extend([line.strip() for line in f.read().splitlines() if line.strip()])
+    terms = [t for t in normalize_batch(raw, normalize_term) if t]
 
-    filters = []
-    params_base = []
-    if args.source:
-        placeholders = ",".join(["?"]*len(args.source))
-        filters.append(f"source_name IN ({placeholders})")
-        params_base.extend(args.source)
-    if args.min_priority is not None:
-        filters.append("priority >= ?")
-        params_base.append(args.min_priority)
-    where_tail = (" AND " + " AND ".join(filters)) if filters else ""
-    and_filters = ("AND " + " AND ".join(filters)) if filters else ""
-
-    for raw in terms:
-        term = jnorm(raw)
-        if not term:
-            continue
-        matches = []
-        seen = set()
-        re_pat = re.compile(rf"\b{re.escape(term)}\b", re.IGNORECASE) if args.wb else None
-        cur = con.cursor()
-
-        if args.exact:
-            cur.execute(
-                f"""
-                SELECT en_text, ja_text, source_name AS source, priority
-                FROM entry_pairs
-                WHERE lower(en_text) = lower(?) {where_tail}
-                LIMIT ?
-                """,
-                [term, *params_base, args.top_k]
-            )
-            for r in cur.fetchall():
-                en, ja = r["en_text"] or "", r["ja_text"] or ""
-                if re_pat and not re_pat.search(en):
-                    continue
-                key = (en.lower(), ja.lower())
-                if key in seen: continue
-                seen.add(key); matches.append([en, ja, r["source"], r["priority"]])
-                if len(matches) >= args.top_k: break
-
-        remain = args.top_k - len(matches)
-        if remain > 0:
-            cur.execute(
-                f"""
-                SELECT e.en_text AS en, e.ja_text AS ja, e.source_name AS source, e.priority AS priority
-                FROM entries_fts
-                JOIN entry_pairs e ON entries_fts.rowid = e.id
-                WHERE entries_fts MATCH ?
-                {and_filters}
-                LIMIT ?
-                """,
-                [term, *params_base, remain*6]
-            )
-            for r in cur.fetchall():
-                en, ja = r["en"] or "", r["ja"] or ""
-                if re_pat and not re_pat.search(en):
-                    continue
-                key = (en.lower(), ja.lower())
-                if key in seen: continue
-                seen.add(key); matches.append([en, ja, r["source"], r["priority"]])
-                if len(matches) >= args.top_k: break
+    if args.exact:
+        con = sqlite3.connect(args.db)
+        ensure_exact_index(con)
+        con.close()
 
-        if args.max_len and matches:
-            def snip(t):
-                if not t: return ""
-                low = t.lower(); ix = low.find(term.lower())
-                if ix < 0: return (t[:args.max_len] + "…") if len(t) > args.max_len else t
-                pad = args.max_len//2; st = max(ix-pad,0); ed = min(ix+len(term)+pad, len(t))
-                s = t[st:ed]; 
-                if st>0: s = "…" + s
-                if ed<len(t): s = s + "…"
-                return s
-            matches = [[snip(en), snip(ja), src, pr] for en,ja,src,pr in matches]
-
-        rec = {"term": term, "candidates": matches}
-        print(json.dumps(rec, ensure_ascii=False))
-    con.close()
+    t0 = time.perf_counter()
+    size = max(1, args.chunk)
+    chunks = [terms[i:i + size] for i in range(0, len(terms), size)]
+    out = open(args.out, "w", encoding="utf-8", newline="\n") if args.out else sys.stdout
+    try:
+        if args.workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=min(args.workers, len(chunks)), mp_context=mp_context(),
+                                     initializer=_worker_init, initargs=(args,)) as ex:
+                for text in ex.map(_worker_chunk, chunks):
+                    out.write(text)
+        else:
+            con = open_readonly(args.db)
+            prepare(con)
+            for chunk in chunks:
+                out.write(resolve_chunk(con, chunk, args))
+            con.close()
+    finally:
+        if args.out:
+            out.close()
+    print(f"[DUMP] terms={len(terms)} chunks={len(chunks)} workers={args.workers} ({time.perf_counter() - t0:.2f}s)", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -226,6 +226,9 @@ renderPromptSelect(); renderPromptList();
 $('#promptSelect').onchange = (e)=> setActivePrompt(e.target.value);
 
 // ===== Search =====
+// ページ送り用カーソル（同じ検索条件のあいだだけ保持。page -> cursor）
+let SEARCH_NAV = { key: '', cursors: {} };
+
 async function doSearch(){
   try{
     const q = $('#q').value.trim();
@@ -246,6 +249,11 @@ async function doSearch(){
     const activeSources = getCheckedSourcesNow();
     activeSources.forEach(s => url.searchParams.append('sources', s));
 
+    // 条件が変わったらカーソルを捨てる。既知のページはカーソルで続きから取得
+    const navKey = [q, size, minp, activeSources.join('\u0000')].join('\u0001');
+    if(SEARCH_NAV.key !== navKey) SEARCH_NAV = { key: navKey, cursors: {} };
+    if(SEARCH_NAV.cursors[page]) url.searchParams.set('cursor', SEARCH_NAV.cursors[page]);
+
     console.log('[SEARCH] url=', url.toString(), 'sources=', activeSources);
 
     const res = await fetch(url);
@@ -256,6 +264,7 @@ async function doSearch(){
       return;
     }
     const data = await res.json();
+    if(data.next_cursor) SEARCH_NAV.cursors[page + 1] = data.next_cursor;
     let items = data.items||[];
     if(hideDup){
       const seen = new Set();
@@ -267,7 +276,8 @@ async function doSearch(){
       });
     }
     renderSearchTable(items, q);
-    $('#searchStatus').textContent = `表示 ${items.length} 件 (page=${page}, size=${size}${hideDup?', 重複除外':''})`;
+    const pages = Math.max(1, Math.ceil((data.total||0) / size));
+    $('#searchStatus').textContent = `表示 ${items.length} 件 / 全 ${data.total||0} 件 (page=${page}/${pages}, size=${size}${hideDup?', 重複除外':''})`;
   }catch(err){
     console.error(err);
     $('#searchStatus').textContent = '検索エラー（Console参照）';
@@ -364,6 +374,13 @@ function onSearchTableKeydown(e){
 }
 function initSearchBindings(){
   $('#btnSearch')?.addEventListener('click', doSearch);
+  const goPage = (d)=>{
+    const el = $('#page'); if(!el) return;
+    el.value = String(Math.max(1, (Number(el.value)||1) + d));
+    doSearch();
+  };
+  $('#btnPrevPage')?.addEventListener('click', ()=>goPage(-1));
+  $('#btnNextPage')?.addEventListener('click', ()=>goPage(1));
   $('#q')?.addEventListener('keydown', e=>{ if(e.key==='Enter') doSearch(); });
   $('#copyTable')?.addEventListener('click', ()=>{
     const rows = [...document.querySelectorAll('#searchTable tbody tr')].map(tr => [...tr.cells].map(td => td.innerText));
@@ -376,6 +393,36 @@ function initSearchBindings(){
 }
 initSearchBindings();
 
+// ===== Background jobs =====
+// 取込/照合はジョブとして投げて進捗をポーリングする。job_id は localStorage に置き、再読み込み後も続きを待つ
+async function waitJob(jobId, onProgress){
+  for(;;){
+    const res = await fetch(`/jobs/${jobId}`);
+    if(!res.ok) throw new Error(res.status===404 ? 'ジョブが見つかりません（サーバ再起動など）' : `HTTP ${res.status}`);
+    const j = await res.json();
+    if(j.status==='done' || j.status==='error'){
+      const r = await fetch(`/jobs/${jobId}/result`);
+      const text = await r.text();
+      let data = text;
+      try{ data = JSON.parse(text); }catch{}
+      return { ok: r.ok, status: r.status, data };
+    }
+    onProgress?.(j);
+    await new Promise(r=>setTimeout(r, 1000));
+  }
+}
+function jobProgressText(j){
+  const p = j.progress || {};
+  if(j.status==='queued') return '順番待ち…';
+  const parts = [p.phase || '実行中'];
+  if(p.files_total) parts.push(`ファイル ${p.files_parsed||0}/${p.files_total}`);
+  if(p.rows_parsed) parts.push(`解析 ${p.rows_parsed} 行`);
+  if(p.rows_upserted) parts.push(`登録 ${p.rows_upserted} 行`);
+  if(p.lines_total) parts.push(`照合 ${p.lines_matched||0}/${p.lines_total} 行`);
+  if(p.rows_per_sec) parts.push(`${p.rows_per_sec} 行/秒`);
+  return parts.join(' / ') + ` (${j.elapsed_sec}s)`;
+}
+
 // ===== Import (XML) =====
 function initImportBindings(){
   const btn = $('#btnXML'); const st  = $('#importStatus');
@@ -422,23 +469,37 @@ function initImportBindings(){
     console.log('[IMPORT/XML] start', {en:en.name,sizeEN:en.size, ja:ja.name,sizeJA:ja.size, srcEN, srcJA, prio, strict, replace_src});
 
     try{
-      const res = await fetch('/import/xml', { method:'POST', body: fd });
-
-      if (!res.ok) {
-        const text = await res.text(); // ★一度だけ読む
-        let detail = text;
-        try {
-          const j = JSON.parse(text);
-          detail = (j && j.detail !== undefined) ? j.detail : j;
-        } catch {}
-        console.error('[IMPORT/XML] HTTP error', res.status, detail);
+      const res = await fetch('/jobs/import/xml', { method:'POST', body: fd });
+      if(!res.ok){
+        st.textContent = `エラー: HTTP ${res.status} ${await res.text()}`;
+        st.className = 'status error';
+        return;
+      }
+      const { job_id } = await res.json();
+      localStorage.setItem('tdb-job-import', job_id);
+      await followImportJob(job_id);
+    }catch(err){
+      console.error('[IMPORT/XML] fetch error', err);
+      st.textContent = `エラー: ${err.message}`;
+      st.className = 'status error';
+    }
+  };
+
+  async function followImportJob(jobId){
+    try{
+      const r = await waitJob(jobId, j=>{ st.textContent = `取り込み中… ${jobProgressText(j)}`; st.className = 'status'; });
+      localStorage.removeItem('tdb-job-import');
+
+      if (!r.ok) {
+        const detail = (r.data && r.data.detail !== undefined) ? r.data.detail : r.data;
+        console.error('[IMPORT/XML] HTTP error', r.status, detail);
         const msg = (typeof detail === 'string') ? detail : JSON.stringify(detail, null, 2);
         st.textContent = `エラー: ${msg}`;
         st.className = 'status error';
         return;
       }
 
-      const data = await res.json();
+      const data = r.data;
       console.log('[IMPORT/XML] done', data);
 
       const extra = data.stats
@@ -455,11 +516,16 @@ function initImportBindings(){
       }catch(e){ console.warn('sources refresh failed', e); }
 
     }catch(err){
-      console.error('[IMPORT/XML] fetch error', err);
+      localStorage.removeItem('tdb-job-import');
+      console.error('[IMPORT/XML] job error', err);
       st.textContent = `エラー: ${err.message}`;
       st.className = 'status error';
     }
-  };
+  }
+
+  // 再読み込み前に投げたジョブがあれば続きを待つ
+  const pending = localStorage.getItem('tdb-job-import');
+  if(pending) followImportJob(pending);
 }
 initImportBindings();
 
@@ -478,14 +544,37 @@ async function runQuery(){
 
   console.log('[QUERY] lines=', lines.length, 'sources=', sources);
 
+  // NDJSON（1行1語）で受け取り、届いた分から表に追加する
   const res = await fetch('/query',{
     method:'POST',
     headers:{'Content-Type':'application/json'},
-    body:JSON.stringify({lines, top_k, max_len, exact, word_boundary, min_priority, sources})
+    body:JSON.stringify({lines, top_k, max_len, exact, word_boundary, min_priority, sources, stream:true})
   });
-  const data = await res.json();
+  if(!res.ok){
+    console.error('[QUERY] http error', res.status, await res.text());
+    $('#queryStatus').textContent = `照会エラー: HTTP ${res.status}`;
+    return;
+  }
+  const data = [];
   window._lastQuery = data;
-  renderQueryTable(data, top_k);
+  renderQueryTable([], top_k);
+  const reader = res.body.getReader();
+  const dec = new TextDecoder();
+  let buf = '';
+  const flush = (chunk)=>{
+    const rows = chunk.filter(Boolean).map(l=>JSON.parse(l));
+    for(const r of rows) data.push(r);
+    appendQueryRows(rows, top_k);
+  };
+  for(;;){
+    const {value, done} = await reader.read();
+    if(done) break;
+    buf += dec.decode(value, {stream:true});
+    const parts = buf.split('\n'); buf = parts.pop();
+    flush(parts);
+    $('#queryStatus').textContent = `照会中… ${data.length} / ${lines.length} 行`;
+  }
+  flush([buf + dec.decode()]);
   $('#queryStatus').textContent = `対象 ${data.length} 行`;
 }
 function renderQueryTable(rows, topk){
@@ -496,6 +585,12 @@ function renderQueryTable(rows, topk){
     thead.rows[0].innerHTML = `<th style="width:20%">Term</th>` +
       Array.from({length: topk}, (_,i)=>`<th>候補${i+1}</th>`).join('');
   }
+  appendQueryRows(rows, topk);
+}
+function appendQueryRows(rows, topk){
+  const t = $('#queryTable');
+  const tb = t.tBodies[0];
+  const frag = document.createDocumentFragment();
   for(const r of rows){
     const tr = document.createElement('tr');
     const tdTerm = document.createElement('td'); tdTerm.textContent = r.term; tr.appendChild(tdTerm);
@@ -515,9 +610,10 @@ function renderQueryTable(rows, topk){
       }
       tr.appendChild(td);
     }
-    tb.appendChild(tr);
+    frag.appendChild(tr);
   }
-  t.hidden = rows.length===0;
+  tb.appendChild(frag);
+  t.hidden = tb.rows.length===0;
 }
 $('#btnRun').onclick = runQuery;
 
@@ -792,7 +888,7 @@ function initCompareBindings(){
 initCompareBindings();
 
 // ===== Matcher (BG3 MOD↔公式) =====
-let MATCH_LAST = { matched_xml:null, unmatched_xml:null, review_csv:null, counts:null };
+let MATCH_LAST = { result_id:null, artifacts:{}, counts:null };
 async function matcherRun(){
   const st = $('#m_status'); st.textContent='送信中…'; st.className='status';
   try{
@@ -821,31 +917,54 @@ async function matcherRun(){
     fd.append('enable_fuzzy', String(fuzzy));
     fd.append('cutoff', String(cutoff));
     fd.append('workers', String(workers));
-    const res = await fetch('/match/bg3', { method:'POST', body: fd });
+    if($('#m_rematch')?.checked) fd.append('rematch', 'true');
+    const res = await fetch('/jobs/match/bg3', { method:'POST', body: fd });
     if(!res.ok){ const text = await res.text(); st.textContent=`エラー: HTTP ${res.status} ${text}`; st.className='status error'; return; }
-    const data = await res.json();
-    MATCH_LAST.matched_xml = data.matched_xml || null;
-    MATCH_LAST.matched_ja_xml = data.matched_ja_xml || null;
-    MATCH_LAST.unmatched_xml = data.unmatched_xml || null;
-    MATCH_LAST.review_csv = data.review_csv || null;
+    const { job_id } = await res.json();
+    localStorage.setItem('tdb-job-match', job_id);
+    await followMatchJob(job_id);
+  }catch(err){ console.error(err); st.textContent='エラー: '+err.message; st.className='status error'; }
+}
+async function followMatchJob(jobId){
+  const st = $('#m_status');
+  try{
+    const r = await waitJob(jobId, j=>{ st.textContent = `照合中… ${jobProgressText(j)}`; st.className='status'; });
+    localStorage.removeItem('tdb-job-match');
+    if(!r.ok){ st.textContent=`エラー: HTTP ${r.status} ${typeof r.data==='string' ? r.data : JSON.stringify(r.data)}`; st.className='status error'; return; }
+    const data = r.data;
+    const enDir = $('#m_enDir').value, jaDir = $('#m_jaDir').value;
+    // 結果本体はサーバーに保存されている。ここでは ID とダウンロード先だけ持つ
+    MATCH_LAST.result_id = data.result_id || null;
+    MATCH_LAST.artifacts = data.artifacts || {};
     MATCH_LAST.counts = data.counts || null;
     const c = MATCH_LAST.counts||{};
-    $('#m_resultInfo').textContent = `完了: JAあり=${c.matched_ja||0} / JAなし=${c.matched_noja||0} / EN未一致=${c.unmatched||0}  (mod=${c.mod||0}, EN=${enDir}, JA=${jaDir})`;
+    $('#m_resultInfo').textContent = `完了: JAあり=${c.matched_ja||0} / JAなし=${c.matched_noja||0} / EN未一致=${c.unmatched||0} / 再利用=${c.reused||0}  (mod=${c.mod||0}, EN=${enDir}, JA=${jaDir})`;
     st.textContent='完了'; st.className='status ok';
-  }catch(err){ console.error(err); st.textContent='エラー: '+err.message; st.className='status error'; }
+  }catch(err){ localStorage.removeItem('tdb-job-match'); console.error(err); st.textContent='エラー: '+err.message; st.className='status error'; }
 }
-function matcherClear(){ $('#m_modXML').value=''; $('#m_enDir').value=''; $('#m_jaDir').value=''; $('#m_status').textContent=''; $('#m_resultInfo').textContent=''; MATCH_LAST={matched_xml:null,unmatched_xml:null,review_csv:null,counts:null}; }
+function matcherClear(){ $('#m_modXML').value=''; $('#m_enDir').value=''; $('#m_jaDir').value=''; $('#m_status').textContent=''; $('#m_resultInfo').textContent=''; MATCH_LAST={result_id:null,artifacts:{},counts:null}; }
 function downloadText(filename, content, mime='text/plain'){
   const blob = new Blob([content], {type: mime + ';charset=utf-8'});
   const url = URL.createObjectURL(blob); const a = document.createElement('a'); a.href=url; a.download=filename; document.body.appendChild(a); a.click(); a.remove(); URL.revokeObjectURL(url);
 }
+function matchArtifactUrl(kind){ return MATCH_LAST.artifacts?.[kind]?.url || null; }
+function downloadUrl(url){
+  // サーバー側の Content-Disposition のファイル名でそのまま保存させる（ブラウザにメモリ展開しない）
+  const a = document.createElement('a'); a.href=url; a.download=''; document.body.appendChild(a); a.click(); a.remove();
+}
+async function fetchMatchArtifact(kind){
+  const url = matchArtifactUrl(kind); if(!url) return '';
+  const res = await fetch(url);
+  if(!res.ok) throw new Error(`HTTP ${res.status}`);
+  return await res.text();
+}
 function initMatcherBindings(){
   $('#m_btnRun')?.addEventListener('click', matcherRun);
   $('#m_btnClear')?.addEventListener('click', matcherClear);
-  $('#m_dlMatched')?.addEventListener('click', ()=>{ if(!MATCH_LAST.matched_xml){ alert('未生成です'); return; } downloadText('bg3_out_matched_ja.xml', MATCH_LAST.matched_xml, 'application/xml'); });
-  $('#m_dlUnmatched')?.addEventListener('click', ()=>{ if(!MATCH_LAST.unmatched_xml){ alert('未生成です'); return; } downloadText('bg3_out_unmatched_src.xml', MATCH_LAST.unmatched_xml, 'application/xml'); });
-  $('#m_dlReview')?.addEventListener('click', ()=>{ if(!MATCH_LAST.review_csv){ alert('fuzzy無効では出力されません'); return; } downloadText('bg3_review_pairs.csv', MATCH_LAST.review_csv, 'text/csv'); });
-  $('#m_toCompare')?.addEventListener('click', ()=>{
+  $('#m_dlMatched')?.addEventListener('click', ()=>{ const u = matchArtifactUrl('matched_xml'); if(!u){ alert('未生成です'); return; } downloadUrl(u); });
+  $('#m_dlUnmatched')?.addEventListener('click', ()=>{ const u = matchArtifactUrl('unmatched_xml'); if(!u){ alert('未生成です'); return; } downloadUrl(u); });
+  $('#m_dlReview')?.addEventListener('click', ()=>{ if(!MATCH_LAST.result_id){ alert('未生成です'); return; } const u = matchArtifactUrl('review_csv'); if(!u){ alert('fuzzy無効では出力されません'); return; } downloadUrl(u); });
+  $('#m_toCompare')?.addEventListener('click', async ()=>{
     try{
       const srcLeft = $('#m_modXML')?.files?.[0];
       // 左：MOD原文（アップロードしたXMLを読み込む）
@@ -853,12 +972,12 @@ function initMatcherBindings(){
         const fr = new FileReader();
         fr.onload = ()=>{ $('#cmpEN').value = String(fr.result||''); };
         fr.readAsText(srcLeft, 'utf-8');
-      } else if (MATCH_LAST.unmatched_xml){
+      } else if (matchArtifactUrl('unmatched_xml')){
         // 代替：EN側に unmatched を置く
-        $('#cmpEN').value = MATCH_LAST.unmatched_xml;
+        $('#cmpEN').value = await fetchMatchArtifact('unmatched_xml');
       }
       // 右：JAありだけ（matched_ja_xml）。無ければ matched 全体
-      const right = MATCH_LAST.matched_ja_xml || MATCH_LAST.matched_xml || '';
+      const right = await fetchMatchArtifact(matchArtifactUrl('matched_ja_xml') ? 'matched_ja_xml' : 'matched_xml');
       $('#cmpJA').value = right;
       showTab('compare');
       // 即比較を実行
@@ -884,5 +1003,8 @@ function initMatcherBindings(){
   // 既定パス（未入力時）
   if(!$('#m_enDir').value){ $('#m_enDir').placeholder = $('#m_enDir').placeholder || 'data\\bundles\\bg3_official\\English'; $('#m_enDir').value = 'data\\bundles\\bg3_official\\English'; }
   if(!$('#m_jaDir').value){ $('#m_jaDir').placeholder = $('#m_jaDir').placeholder || 'data\\bundles\\bg3_official\\Japanese'; $('#m_jaDir').value = 'data\\bundles\\bg3_official\\Japanese'; }
+  // 再読み込み前に投げた照合ジョブがあれば続きを待つ
+  const pending = localStorage.getItem('tdb-job-match');
+  if(pending) followMatchJob(pending);
 }
 initMatcherBindings();